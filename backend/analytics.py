@@ -0,0 +1,137 @@
+"""
+Buffer in memoria per le visualizzazioni (collection content_views).
+
+Le route non aspettano più un insert_one per ogni pagina vista: record()
+mette l'evento in coda e ritorna subito, e un task in background scrive
+con insert_many quando la coda raggiunge ANALYTICS_BATCH_SIZE eventi o
+ogni ANALYTICS_FLUSH_INTERVAL secondi. La coda è limitata a
+ANALYTICS_BUFFER_MAX eventi: oltre, i nuovi eventi vengono scartati (e
+contati) invece di far crescere la memoria se Mongo non risponde.
+Allo shutdown la coda viene svuotata. Ogni batch scritto aggiorna anche i
+contatori della dashboard (stats_rollup).
+"""
+import os
+import asyncio
+import logging
+from collections import deque
+
+from pymongo.errors import BulkWriteError
+
+from stats_rollup import record_views
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_BATCH_SIZE = int(os.getenv("ANALYTICS_BATCH_SIZE", "500"))
+ANALYTICS_FLUSH_INTERVAL = float(os.getenv("ANALYTICS_FLUSH_INTERVAL", "2"))
+ANALYTICS_BUFFER_MAX = int(os.getenv("ANALYTICS_BUFFER_MAX", "50000"))
+
+
+class ViewBuffer:
+    def __init__(self, collection="content_views", batch_size=ANALYTICS_BATCH_SIZE,
+                 flush_interval=ANALYTICS_FLUSH_INTERVAL, max_size=ANALYTICS_BUFFER_MAX):
+        self.collection = collection
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_size = max_size
+        self._queue = deque()
+        self._db = None
+        self._task = None
+        self._wakeup = None
+        self._stopping = False
+        self.written = 0
+        self.dropped = 0
+        self.failed_flushes = 0
+
+    def record(self, view: dict):
+        """Accoda un evento; non fa I/O e non blocca."""
+        if len(self._queue) >= self.max_size:
+            self.dropped += 1
+            return
+        self._queue.append(view)
+        if len(self._queue) >= self.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+
+    async def start(self, db):
+        if self._task is not None:
+            return
+        self._db = db
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            # Niente cancel: il task termina il flush in corso ed esce
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        # Ultimo giro: scrive tutto quello che è rimasto in coda
+        while self._queue and await self.flush():
+            pass
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            while self._queue:
+                if not await self.flush():
+                    break
+                if len(self._queue) < self.batch_size:
+                    break
+
+    async def flush(self):
+        """
+        Scrive fino a batch_size eventi. Restituisce False se la scrittura
+        è fallita: gli eventi tornano in testa alla coda per il giro dopo.
+        """
+        if not self._queue or self._db is None:
+            return False
+        batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+        try:
+            await self._db[self.collection].insert_many(batch, ordered=False)
+        except asyncio.CancelledError:
+            # Il batch non deve sparire con il task: torna in testa alla coda
+            self._queue.extendleft(reversed(batch))
+            raise
+        except BulkWriteError as e:
+            # Con ordered=False gli altri documenti sono stati scritti;
+            # quelli rifiutati (es. _id duplicato) non vengono ritentati
+            errors = e.details.get("writeErrors", [])
+            self.written += e.details.get("nInserted", 0)
+            self.dropped += len(errors)
+            logger.warning(f"Some content views were rejected: {errors[:1]}")
+            rejected = {err["index"] for err in errors}
+            await self._update_rollups([v for i, v in enumerate(batch) if i not in rejected])
+            return True
+        except Exception as e:
+            self.failed_flushes += 1
+            logger.warning(f"Could not flush {len(batch)} content views: {e}")
+            room = self.max_size - len(self._queue)
+            self.dropped += max(len(batch) - room, 0)
+            self._queue.extendleft(reversed(batch[:max(room, 0)]))
+            return False
+        self.written += len(batch)
+        await self._update_rollups(batch)
+        return True
+
+    async def _update_rollups(self, views):
+        # I contatori della dashboard non devono far ritentare il batch
+        try:
+            await record_views(self._db, views)
+        except Exception as e:
+            logger.warning(f"Could not update view rollups: {e}")
+
+    def stats(self):
+        return {
+            "queued": len(self._queue),
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed_flushes": self.failed_flushes,
+        }
+
+
+view_buffer = ViewBuffer()
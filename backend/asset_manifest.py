@@ -0,0 +1,168 @@
+"""
+Manifest degli asset sotto static/images: ogni file ha un nome con
+fingerprint del contenuto.
+
+    images/posts/gradient.png  ->  images/posts/gradient.3f2a1b9c04de.png
+
+Il renderer (process_image_links) scrive nelle pagine gli URL con
+fingerprint; PrecompressedStaticFiles li riconosce, serve il file
+originale e, se l'hash è ancora quello del file, aggiunge
+Cache-Control: immutable con max-age di un anno. Un hash non più valido
+(immagine cambiata dopo che la pagina è stata renderizzata e messa in
+cache) serve comunque il file attuale, ma senza cache lunga.
+
+Il manifest si tiene in memoria: l'hash di un file si ricalcola solo se
+ne cambiano mtime o dimensione, controllati con uno stat ad ogni uso,
+così un'immagine riscritta ha subito il nuovo hash (e le pagine in cache
+che puntano al vecchio vengono rifatte, vedi content_cache.py). La
+directory intera si riguarda al massimo ogni ASSET_MANIFEST_CHECK_INTERVAL
+secondi, solo per mapping() e combined_digest().
+
+    python asset_manifest.py    # stampa il manifest
+"""
+import os
+import re
+import json
+import stat
+import time
+import hashlib
+import threading
+
+STATIC_DIR = "static"
+ASSET_DIRS = ("images",)
+ASSET_HASH_LENGTH = 12
+ASSET_MANIFEST_CHECK_INTERVAL = float(os.getenv("ASSET_MANIFEST_CHECK_INTERVAL", "5"))
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Le varianti precompresse seguono l'URL dell'originale
+_SKIP_SUFFIXES = (".gz", ".br", ".tmp")
+_FINGERPRINT_RE = re.compile(r"^(.*)\.([0-9a-f]{%d})(\.[^./]+)$" % ASSET_HASH_LENGTH)
+
+
+def fingerprinted_name(path, digest):
+    stem, ext = os.path.splitext(path)
+    return f"{stem}.{digest}{ext}"
+
+
+def split_fingerprint(path):
+    """(percorso originale, hash) per un nome con fingerprint, altrimenti (path, None)."""
+    match = _FINGERPRINT_RE.match(path)
+    if not match:
+        return path, None
+    return match.group(1) + match.group(3), match.group(2)
+
+
+def _file_digest(full_path):
+    h = hashlib.sha256()
+    with open(full_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            h.update(chunk)
+    return h.hexdigest()[:ASSET_HASH_LENGTH]
+
+
+class AssetManifest:
+    def __init__(self, static_dir=STATIC_DIR, asset_dirs=ASSET_DIRS, check_interval=ASSET_MANIFEST_CHECK_INTERVAL):
+        self.static_dir = static_dir
+        self.asset_dirs = asset_dirs
+        self.check_interval = check_interval
+        self._entries = {}  # percorso relativo -> (mtime, size, hash)
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def _scan(self):
+        entries = {}
+        for asset_dir in self.asset_dirs:
+            for root, _, files in os.walk(os.path.join(self.static_dir, asset_dir)):
+                for name in files:
+                    if name.endswith(_SKIP_SUFFIXES):
+                        continue
+                    full_path = os.path.join(root, name)
+                    rel = os.path.relpath(full_path, self.static_dir).replace("\\", "/")
+                    try:
+                        st = os.stat(full_path)
+                    except OSError:
+                        continue
+                    entries[rel] = self._entry(rel, full_path, st)
+        self._entries = entries
+
+    def _entry(self, rel, full_path, st):
+        old = self._entries.get(rel)
+        if old and old[0] == st.st_mtime_ns and old[1] == st.st_size:
+            return old
+        return (st.st_mtime_ns, st.st_size, _file_digest(full_path))
+
+    def refresh(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._checked < self.check_interval:
+            return
+        with self._lock:
+            if force or now - self._checked >= self.check_interval:
+                self._scan()
+                self._checked = time.monotonic()
+
+    def digest(self, rel_path):
+        """Hash attuale del file (None se non esiste o non è un asset)."""
+        if (
+            not rel_path.startswith(tuple(f"{d}/" for d in self.asset_dirs))
+            or rel_path.endswith(_SKIP_SUFFIXES)
+            or os.path.normpath(rel_path).replace("\\", "/") != rel_path
+        ):
+            return None
+        full_path = os.path.join(self.static_dir, rel_path)
+        try:
+            st = os.stat(full_path)
+        except OSError:
+            self._entries.pop(rel_path, None)
+            return None
+        if not stat.S_ISREG(st.st_mode):
+            return None
+        entry = self._entry(rel_path, full_path, st)
+        self._entries[rel_path] = entry
+        return entry[2]
+
+    def matches(self, images):
+        """
+        True se ogni immagine in images ({percorso relativo: hash usato nella
+        pagina, o None se non c'era}) ha ancora lo stesso hash.
+        """
+        return all(self.digest(rel) == digest for rel, digest in images.items())
+
+    def url(self, rel_path):
+        """URL /static/... con fingerprint, o senza se il file non è nel manifest."""
+        digest = self.digest(rel_path)
+        if digest is None:
+            return f"/{STATIC_DIR}/{rel_path}"
+        return f"/{STATIC_DIR}/{fingerprinted_name(rel_path, digest)}"
+
+    def resolve(self, rel_path):
+        """
+        Per un percorso richiesto sotto /static restituisce
+        (percorso del file, immutable). immutable è True solo se il
+        percorso ha un fingerprint che corrisponde al contenuto attuale.
+        """
+        original, digest = split_fingerprint(rel_path)
+        if digest is None:
+            return rel_path, False
+        current = self.digest(original)
+        if current is None:
+            return rel_path, False  # non è un asset: lo cerca così com'è
+        return original, current == digest
+
+    def combined_digest(self):
+        """Hash dell'intero manifest, per versionare il build offline."""
+        self.refresh(force=True)
+        h = hashlib.sha256()
+        for rel, entry in sorted(self._entries.items()):
+            h.update(f"{rel}\0{entry[2]}\n".encode("utf-8"))
+        return h.hexdigest()
+
+    def mapping(self):
+        self.refresh(force=True)
+        return {rel: fingerprinted_name(rel, entry[2]) for rel, entry in sorted(self._entries.items())}
+
+
+asset_manifest = AssetManifest()
+
+
+if __name__ == "__main__":
+    print(json.dumps(asset_manifest.mapping(), indent=2))
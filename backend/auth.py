@@ -3,13 +3,16 @@ from typing import Optional
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from fastapi import Request
-from authlib.integrations.httpx_client import AsyncOAuth2Client
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 import os
 from models import UserInDB, TokenData
 from database import db
+from stats_rollup import record_login
+from user_cache import user_cache
+from executors import password_executor, ExecutorBusy
 from bson import ObjectId  # Import per la gestione di ObjectId
+import oidc
 
 # JWT Authentication settings
 SECRET_KEY = os.getenv("JWT_SECRET", "supersecretkey")
@@ -22,8 +25,10 @@ GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
 GOOGLE_REDIRECT_URI = os.getenv("GOOGLE_REDIRECT_URI")
 GOOGLE_DISCOVERY_URL = os.getenv("GOOGLE_DISCOVERY_URL") #"https://accounts.google.com/.well-known/openid-configuration"
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Password hashing (work factor di bcrypt; gli hash esistenti con un altro
+# numero di round restano verificabili)
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 # Funzioni per la gestione delle password
@@ -33,6 +38,24 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+# bcrypt costa centinaia di ms di CPU: le route usano queste versioni, che
+# girano nel pool dedicato e rispondono 503 se la coda è piena
+async def _run_password_job(fn, *args):
+    try:
+        return await password_executor.run(fn, *args)
+    except ExecutorBusy:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many login requests, please retry shortly",
+            headers={"Retry-After": "1"},
+        )
+
+async def verify_password_async(plain_password, hashed_password):
+    return await _run_password_job(verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password):
+    return await _run_password_job(get_password_hash, password)
+
 # Funzione per recuperare un utente dal database
 async def get_user(username: str):
     user = await db["users"].find_one({"username": username})
@@ -46,43 +69,29 @@ async def authenticate_user(username: str, password: str):
     user = await get_user(username)
     if not user:
         return False
-    if not verify_password(password, user.hashed_password):
+    if not await verify_password_async(password, user.hashed_password):
         return False
     
-    # Update last_login time
-    await db["users"].update_one(
+    # Update last_login time (e sposta l'utente nei contatori della dashboard)
+    now = datetime.utcnow()
+    previous = await db["users"].find_one_and_update(
         {"username": username},
-        {"$set": {"last_login": datetime.utcnow()}}
+        {"$set": {"last_login": now}},
+        projection={"last_login": 1},
     )
+    user_cache.invalidate(username)
+    try:
+        await record_login(db, previous.get("last_login") if previous else None, now)
+    except Exception:
+        pass  # I contatori non devono bloccare il login
     
     return user
 
 ## Funzione per autenticare l'utente tramite Google
 async def get_google_user_info(code: str):
-    async with AsyncOAuth2Client(
-        client_id=GOOGLE_CLIENT_ID,
-        client_secret=GOOGLE_CLIENT_SECRET,
-        redirect_uri=GOOGLE_REDIRECT_URI,
-    ) as client:
-        # Ottieni i provider endpoint
-        resp = await client.get(GOOGLE_DISCOVERY_URL)
-        resp.raise_for_status()
-        google_conf = resp.json()
-
-        # Scambia il codice per i token
-        token = await client.fetch_token(
-            token_endpoint=google_conf["token_endpoint"],
-            code=code,
-            grant_type="authorization_code",
-        )
-
-        # Recupera user info con il token
-        resp = await client.get(
-            google_conf["userinfo_endpoint"],
-            headers={"Authorization": f"Bearer {token['access_token']}"}
-        )
-        resp.raise_for_status()
-        return resp.json()
+    # Discovery e JWKS in cache, client HTTP condiviso, id_token verificato
+    # in locale (vedi oidc.py)
+    return await oidc.get_user_info(code)
 
 # Funzione per creare il token di accesso JWT
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -102,17 +111,25 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
+    # Token già visto di recente: niente decodifica né find_one
+    username = user_cache.username_for(token)
+    if username is None:
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            username: str = payload.get("sub")
+            if username is None:
+                raise credentials_exception
+            token_data = TokenData(username=username)
+        except JWTError:
             raise credentials_exception
-        token_data = TokenData(username=username)
-    except JWTError:
-        raise credentials_exception
-    user = await get_user(username=token_data.username)
+        username = token_data.username
+        user_cache.remember_token(token, username, payload.get("exp"))
+    user = user_cache.get(username)
     if user is None:
-        raise credentials_exception
+        user = await get_user(username=username)
+        if user is None:
+            raise credentials_exception
+        user_cache.put(username, user)
     return user
 
 # Funzione per ottenere l'utente attivo
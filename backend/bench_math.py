@@ -0,0 +1,95 @@
+"""
+Benchmark della protezione/ripristino delle formule.
+
+    python bench_math.py [--notes 3] [--scales 1 2 4 8 16] [--repeat 3]
+
+Prende le note di CONTENT_DIR con più formule, le concatena N volte e
+misura protect_math_content + restore_math_content + remove_math_paragraphs
+sullo stesso HTML, per il motore attuale e per la vecchia versione a
+str.replace per formula. Con il motore attuale il tempo per KB deve restare
+circa costante al crescere di N; con la vecchia versione cresce con N.
+"""
+import os
+import re
+import time
+import argparse
+
+import markdown
+
+from markdown_utils import (
+    CONTENT_DIR, protect_math_content, restore_math_content, remove_math_paragraphs,
+)
+
+
+def legacy_protect(md_content):
+    math_blocks = []
+
+    def replace_block(match):
+        math_blocks.append(match.group(1))
+        return f'@@MATH_BLOCK_{len(math_blocks)-1}@@'
+
+    def replace_inline(match):
+        math_blocks.append(match.group(0))
+        return f'@@MATH_INLINE_{len(math_blocks)-1}@@'
+
+    protected = re.sub(r'(\$\$.*?\$\$)', replace_block, md_content, flags=re.DOTALL)
+    protected = re.sub(r'(?<!\\)\$([^\$]*?(?<!\\))\$', replace_inline, protected)
+    return protected, math_blocks
+
+
+def legacy_restore(html_content, math_blocks):
+    for i, math in enumerate(math_blocks):
+        html_content = html_content.replace(f'@@MATH_BLOCK_{i}@@', math)
+        html_content = html_content.replace(f'@@MATH_INLINE_{i}@@', math)
+    return html_content
+
+
+ENGINES = {
+    "single-pass": (protect_math_content, restore_math_content),
+    "legacy": (legacy_protect, legacy_restore),
+}
+
+
+def heaviest_notes(count):
+    notes = []
+    for root, _, files in os.walk(CONTENT_DIR):
+        for name in files:
+            if name.endswith(".md"):
+                path = os.path.join(root, name)
+                with open(path, encoding="utf-8") as f:
+                    text = f.read()
+                notes.append((text.count("$"), path, text))
+    notes.sort(reverse=True)
+    return notes[:count]
+
+
+def measure(protect, restore, text, repeat):
+    protected, blocks = protect(text)
+    html = markdown.markdown(protected, extensions=["extra", "nl2br", "sane_lists"])
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        protected, blocks = protect(text)
+        remove_math_paragraphs(restore(html, blocks))
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, len(blocks)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark math protection/restore on the theory notes")
+    parser.add_argument("--notes", type=int, default=3, help="how many of the most formula-dense notes")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 2, 4, 8, 16], help="concatenation factors")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per measurement (best is kept)")
+    args = parser.parse_args()
+
+    for dollars, path, text in heaviest_notes(args.notes):
+        print(f"{os.path.relpath(path, CONTENT_DIR)} ({len(text) // 1024} KB, {dollars} '$')")
+        for scale in args.scales:
+            doc = "\n\n".join([text] * scale)
+            row = [f"  x{scale:<3} {len(doc) // 1024:>6} KB"]
+            for engine, (protect, restore) in ENGINES.items():
+                seconds, blocks = measure(protect, restore, doc, args.repeat)
+                row.append(f"{engine} {seconds * 1000:9.2f} ms ({seconds * 1000 / (len(doc) / 1024):.3f} ms/KB)")
+            row.insert(1, f"{blocks:>6} formulas")
+            print("  ".join(row))
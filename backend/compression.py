@@ -0,0 +1,174 @@
+"""
+Compressione delle risposte (brotli o gzip) negoziata con Accept-Encoding.
+
+Come GZipMiddleware di Starlette, ma:
+
+- usa brotli se il client lo accetta e il pacchetto `brotli` è installato
+  (è opzionale: senza si usa solo gzip);
+- comprime solo i tipi testuali (JSON, HTML, NDJSON, SVG, ...) e solo
+  sopra COMPRESSION_MIN_SIZE byte;
+- lascia intatte le risposte che hanno già un Content-Encoding, ad esempio
+  i file .br/.gz precompressi serviti da static_files.py.
+
+Le risposte in streaming (export NDJSON, FileResponse) vengono compresse
+a pezzi, con un flush per ogni chunk.
+"""
+import os
+import zlib
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # brotli è opzionale: si usa solo gzip
+    brotli = None
+
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))
+
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+)
+
+
+def is_compressible(content_type):
+    media_type = content_type.split(";", 1)[0].strip().lower()
+    return media_type.startswith("text/") or media_type in COMPRESSIBLE_TYPES
+
+
+def accepted_encodings(accept_encoding):
+    """{codifica: q} dall'header Accept-Encoding."""
+    result = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        result[name.strip()] = q
+    return result
+
+
+def choose_encoding(accept_encoding, available=None):
+    """Codifica preferita fra quelle disponibili (brotli prima di gzip) o None."""
+    if available is None:
+        available = ("br", "gzip") if brotli is not None else ("gzip",)
+    accepted = accepted_encodings(accept_encoding)
+    for encoding in available:
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+class _GzipCompressor:
+    def __init__(self):
+        # wbits 31: formato gzip (header e trailer)
+        self._obj = zlib.compressobj(COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self._obj.compress(data) + self._obj.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data=b""):
+        return self._obj.compress(data) + self._obj.flush()
+
+
+class _BrotliCompressor:
+    def __init__(self):
+        self._obj = brotli.Compressor(quality=COMPRESSION_BROTLI_QUALITY)
+
+    def compress(self, data):
+        return self._obj.process(data) + self._obj.flush()
+
+    def finish(self, data=b""):
+        return self._obj.process(data) + self._obj.finish()
+
+
+COMPRESSORS = {"gzip": _GzipCompressor, "br": _BrotliCompressor}
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size=COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        responder = _CompressionResponder(self.app, encoding, self.minimum_size)
+        await responder(scope, receive, send)
+
+
+class _CompressionResponder:
+    def __init__(self, app, encoding, minimum_size):
+        self.app = app
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.send = None
+        self.start_message = None
+        self.compressor = None  # None finché non si decide; False = passthrough
+
+    async def __call__(self, scope, receive, send):
+        self.send = send
+        await self.app(scope, receive, self.send_compressed)
+
+    async def send_compressed(self, message):
+        if message["type"] == "http.response.start":
+            # Si decide al primo chunk del body, quando se ne conosce la dimensione
+            self.start_message = message
+            return
+        if message["type"] != "http.response.body":
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.compressor is None:
+            headers = Headers(raw=self.start_message["headers"])
+            if (
+                "content-encoding" in headers
+                or not is_compressible(headers.get("content-type", ""))
+                or (not more_body and len(body) < self.minimum_size)
+            ):
+                self.compressor = False
+                await self.send(self.start_message)
+                await self.send(message)
+                return
+
+            self.compressor = COMPRESSORS[self.encoding]()
+            headers = MutableHeaders(raw=self.start_message["headers"])
+            headers["Content-Encoding"] = self.encoding
+            headers.add_vary_header("Accept-Encoding")
+            if not more_body:
+                body = self.compressor.finish(body)
+                headers["Content-Length"] = str(len(body))
+                await self.send(self.start_message)
+                await self.send({"type": "http.response.body", "body": body})
+                return
+            del headers["Content-Length"]
+            await self.send(self.start_message)
+
+        if self.compressor is False:
+            await self.send(message)
+            return
+
+        if more_body:
+            chunk = self.compressor.compress(body)
+        else:
+            chunk = self.compressor.finish(body)
+        await self.send({"type": "http.response.body", "body": chunk, "more_body": more_body})
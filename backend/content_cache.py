@@ -0,0 +1,317 @@
+"""
+Cache in memoria delle pagine di teoria già renderizzate.
+
+Il contenuto in content/theory cambia solo quando gira update_content.sh,
+quindi non ha senso rifare tutta la pipeline di parse_markdown_content
+(python-markdown, Pygments, regex) ad ogni GET /theory/{path}.
+
+Ogni voce è indicizzata per percorso normalizzato del file e validata con
+(mtime, size); se lo stat cambia ma l'hash del contenuto è lo stesso
+(es. file ricopiato identico) la voce resta valida. Una pagina dipende
+anche dai link [[...]] verso altre note, quindi ogni voce ricorda come
+sono stati risolti i suoi link: quando il link_index cambia versione
+(note aggiunte o rimosse) vengono rifatte solo le pagine i cui link ora
+puntano altrove. Allo stesso modo ogni voce ricorda l'hash delle immagini
+negli URL con fingerprint e viene rifatta se nell'asset_manifest è
+cambiato. In caso di miss si prova prima l'artefatto
+prodotto da static_build.py e solo dopo si renderizza. La cache è un LRU
+limitato sia per numero di voci che per byte totali.
+
+Dalle route async il rendering passa da render_executor, che con
+RENDER_BACKEND=process usa processi separati (python-markdown e Pygments
+tengono il GIL); richieste concorrenti per la stessa pagina non in cache
+condividono un unico rendering.
+"""
+import os
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+from fastapi import HTTPException
+
+from markdown_utils import CONTENT_DIR, render_markdown_with_links, render_markdown_in_worker, link_index
+from asset_manifest import asset_manifest
+from static_build import artifacts
+from executors import io_executor, render_executor
+
+logger = logging.getLogger(__name__)
+
+THEORY_CACHE_MAX_BYTES = int(os.getenv("THEORY_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+THEORY_CACHE_MAX_ENTRIES = int(os.getenv("THEORY_CACHE_MAX_ENTRIES", "1024"))
+# "off" (default), "all" per renderizzare tutte le note, "top" per le più viste
+THEORY_CACHE_PREWARM = os.getenv("THEORY_CACHE_PREWARM", "off").lower()
+THEORY_CACHE_PREWARM_TOP = int(os.getenv("THEORY_CACHE_PREWARM_TOP", "50"))
+
+
+class _Entry:
+    __slots__ = ("mtime_ns", "size", "digest", "link_version", "links", "images", "page", "nbytes")
+
+    def __init__(self, mtime_ns, size, digest, link_version, links, images, page):
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.digest = digest
+        self.link_version = link_version
+        self.links = links
+        self.images = images
+        self.page = page
+        self.nbytes = len(page["title"].encode("utf-8")) + len(page["content"].encode("utf-8"))
+
+
+class _RenderJob:
+    __slots__ = ("st", "digest", "link_version", "text")
+
+    def __init__(self, st, digest, link_version, text):
+        self.st = st
+        self.digest = digest
+        self.link_version = link_version
+        self.text = text
+
+
+class RenderedPageCache:
+    def __init__(self, max_bytes=THEORY_CACHE_MAX_BYTES, max_entries=THEORY_CACHE_MAX_ENTRIES):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def peek(self, full_path: str):
+        """
+        Restituisce la pagina se è in cache ed è ancora valida, senza mai
+        leggere o renderizzare il file (None altrimenti). Solleva
+        FileNotFoundError se la nota non esiste.
+        """
+        st = os.stat(full_path)
+        return self._valid_page(full_path, st, link_index.refresh())
+
+    def _valid_page(self, full_path, st, link_version):
+        with self._lock:
+            entry = self._entries.get(full_path)
+            if entry and entry.link_version != link_version:
+                if link_index.resolves_same(entry.links):
+                    entry.link_version = link_version
+                else:
+                    entry = None
+            if entry and not asset_manifest.matches(entry.images):
+                # Un'immagine è cambiata: l'URL con il vecchio hash è immutable
+                entry = None
+            if entry and entry.mtime_ns == st.st_mtime_ns and entry.size == st.st_size:
+                self._entries.move_to_end(full_path)
+                self.hits += 1
+                return entry.page
+        return None
+
+    def prepare(self, full_path: str):
+        """
+        Prima metà di get(): legge il file e prova cache e artefatti.
+        Restituisce (pagina, None) se non serve renderizzare, altrimenti
+        (None, job) da passare al renderer e poi a complete().
+        """
+        st = os.stat(full_path)
+        link_version = link_index.refresh()
+        page = self._valid_page(full_path, st, link_version)
+        if page is not None:
+            return page, None
+
+        with open(full_path, "rb") as f:
+            raw = f.read()
+        digest = hashlib.sha256(raw).hexdigest()
+
+        with self._lock:
+            entry = self._entries.get(full_path)
+            if (
+                entry and entry.digest == digest and entry.link_version == link_version
+                and asset_manifest.matches(entry.images)
+            ):
+                # Stesso contenuto, cambia solo lo stat: aggiorniamo e basta
+                entry.mtime_ns = st.st_mtime_ns
+                entry.size = st.st_size
+                self._entries.move_to_end(full_path)
+                self.hits += 1
+                return entry.page, None
+            self.misses += 1
+
+        job = _RenderJob(st, digest, link_version, raw.decode("utf-8"))
+        artifact = artifacts.load_page(full_path, digest)
+        if artifact is not None:
+            return self.complete(full_path, job, *artifact), None
+        return None, job
+
+    def complete(self, full_path, job, page, links, images):
+        """Seconda metà di get(): salva in cache la pagina renderizzata."""
+        self._store(full_path, _Entry(
+            job.st.st_mtime_ns, job.st.st_size, job.digest, job.link_version, links, images, page
+        ))
+        return page
+
+    def get(self, full_path: str):
+        """
+        Restituisce la pagina renderizzata per full_path, renderizzandola
+        (e salvandola) solo se manca o se il file è cambiato.
+        """
+        page, job = self.prepare(full_path)
+        if page is not None:
+            return page
+        return self.complete(full_path, job, *render_markdown_with_links(job.text))
+
+    def _store(self, key, entry):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old:
+                self._bytes -= old.nbytes
+            if entry.nbytes > self.max_bytes:
+                return
+            self._entries[key] = entry
+            self._bytes += entry.nbytes
+            while self._entries and (
+                self._bytes > self.max_bytes or len(self._entries) > self.max_entries
+            ):
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes
+                self.evictions += 1
+
+    def invalidate(self, full_path: str = None):
+        with self._lock:
+            if full_path is None:
+                self._entries.clear()
+                self._bytes = 0
+                return
+            old = self._entries.pop(full_path, None)
+            if old:
+                self._bytes -= old.nbytes
+
+    def stale_link_paths(self):
+        """Pagine in cache con almeno un link [[...]] che ora punta altrove."""
+        with self._lock:
+            items = list(self._entries.items())
+        return [path for path, entry in items if not link_index.resolves_same(entry.links)]
+
+    def __contains__(self, full_path):
+        with self._lock:
+            return full_path in self._entries
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+page_cache = RenderedPageCache()
+
+
+def get_rendered_page(full_path: str):
+    return page_cache.get(full_path)
+
+
+# Render in corso per percorso: N richieste concorrenti per la stessa
+# pagina non in cache aspettano tutte lo stesso rendering
+_inflight = {}
+
+
+async def get_rendered_page_async(full_path: str):
+    """
+    Versione per le route async: il controllo della cache (stat) gira nel
+    pool di I/O e solo un miss occupa il pool di rendering (thread o
+    processi, vedi RENDER_BACKEND).
+    """
+    page = await io_executor.run(page_cache.peek, full_path)
+    if page is not None:
+        return page
+    task = _inflight.get(full_path)
+    if task is None:
+        task = asyncio.create_task(_render(full_path))
+        _inflight[full_path] = task
+        task.add_done_callback(lambda _: _inflight.pop(full_path, None))
+    # shield: se il client che ha avviato il render si disconnette,
+    # il render continua per gli altri in attesa
+    return await asyncio.shield(task)
+
+
+async def _render(full_path):
+    page, job = await io_executor.run(page_cache.prepare, full_path)
+    if page is not None:
+        return page
+    try:
+        page, links, images = await render_executor.run(render_markdown_in_worker, job.text, link_index.digest)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return page_cache.complete(full_path, job, page, links, images)
+
+
+def _note_paths(paths=None):
+    if paths is None:
+        return [
+            os.path.join(root, f)
+            for root, _, files in os.walk(CONTENT_DIR)
+            for f in files if f.endswith(".md")
+        ]
+    full_paths = [os.path.normpath(os.path.join(CONTENT_DIR, f"{p}.md")) for p in paths]
+    return [p for p in full_paths if p.startswith(CONTENT_DIR) and os.path.exists(p)]
+
+
+def prewarm(paths=None):
+    """
+    Renderizza in anticipo le note indicate (percorsi relativi a CONTENT_DIR,
+    senza .md) oppure, se paths è None, tutte le note del corpus.
+    Restituisce il numero di pagine caricate in cache.
+    """
+    warmed = 0
+    for full_path in _note_paths(paths):
+        try:
+            page_cache.get(full_path)
+            warmed += 1
+        except Exception as e:
+            logger.warning(f"Prewarm failed for {full_path}: {e}")
+    return warmed
+
+
+async def prewarm_async(full_paths):
+    """Come prewarm, ma passando dai pool (rispetta RENDER_CONCURRENCY)."""
+    results = await asyncio.gather(
+        *(get_rendered_page_async(p) for p in full_paths), return_exceptions=True
+    )
+    for full_path, result in zip(full_paths, results):
+        if isinstance(result, Exception):
+            logger.warning(f"Prewarm failed for {full_path}: {result}")
+    return sum(1 for r in results if not isinstance(r, Exception))
+
+
+async def prewarm_from_config(db):
+    """
+    Pre-riscaldamento all'avvio secondo THEORY_CACHE_PREWARM:
+    "all" renderizza tutto, "top" solo le THEORY_CACHE_PREWARM_TOP note più viste.
+    Il rendering gira nel pool di rendering per non bloccare l'event loop.
+    """
+    if THEORY_CACHE_PREWARM not in ("all", "top"):
+        return
+    paths = None
+    if THEORY_CACHE_PREWARM == "top":
+        try:
+            top = await db["content_views"].aggregate([
+                {"$match": {"content_type": "theory"}},
+                {"$group": {"_id": "$content_id", "views": {"$sum": 1}}},
+                {"$sort": {"views": -1}},
+                {"$limit": THEORY_CACHE_PREWARM_TOP},
+            ]).to_list(THEORY_CACHE_PREWARM_TOP)
+        except Exception as e:
+            logger.warning(f"Could not load most viewed pages for prewarm: {e}")
+            return
+        paths = [item["_id"] for item in top if item["_id"]]
+
+    full_paths = await io_executor.run(_note_paths, paths)
+    warmed = await prewarm_async(full_paths)
+    logger.info(f"Theory cache prewarmed with {warmed} pages")
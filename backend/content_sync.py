@@ -0,0 +1,210 @@
+"""
+Sincronizzazione incrementale del vault Obsidian in content/theory.
+
+    python content_sync.py [--vault ../../my-obsidian-vault] [--dry-run]
+
+Sostituisce il vecchio rm -rf + cp di update_content.sh:
+
+- confronta per sha256 ogni file del vault con quello copiato l'ultima
+  volta (manifest in build/) e copia solo i file nuovi o modificati;
+- i file vengono prima copiati in una directory di staging e poi spostati
+  al loro posto con os.replace, quindi una nota non sparisce mai durante
+  l'aggiornamento;
+- i file che non esistono più nel vault vengono rimossi dalle directory
+  gestite (le stesse che lo script svuotava);
+- scrive un changelog con i percorsi toccati, usato per invalidare solo
+  le cache e gli indici interessati.
+
+Il confronto usa l'hash del sorgente registrato nel manifest e non il file
+di destinazione, perché tikz_compiler.py riscrive le note dopo la copia.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+
+VAULT_DIR = os.getenv("VAULT_DIR", "../../my-obsidian-vault")
+SYNC_MANIFEST = os.getenv("CONTENT_SYNC_MANIFEST", "build/content_sync_manifest.json")
+SYNC_CHANGELOG = os.getenv("CONTENT_SYNC_CHANGELOG", "build/content_changelog.json")
+STAGING_DIR = ".sync_staging"
+
+ALGORITMI = "00_Informatica/Algoritmi"
+MATEMATICA = "01_Matematica"
+
+# (sorgente nel vault, destinazione): come in update_content.sh, le
+# directory di Matematica vengono copiate come sottocartelle di math-for-ml
+SYNC_MAP = [
+    (f"{ALGORITMI}/Introduzione al Machine Learning", "content/theory/introduction"),
+    (f"{ALGORITMI}/Supervised Learning", "content/theory/supervised-learning"),
+    (f"{ALGORITMI}/Unsupervised Learning", "content/theory/unsupervised-learning"),
+    (f"{ALGORITMI}/Natural Language Processing", "content/theory/nlp"),
+    (f"{MATEMATICA}/Calcolo", "content/theory/math-for-ml/Calcolo"),
+    (f"{MATEMATICA}/Algebra", "content/theory/math-for-ml/Algebra"),
+    (f"{MATEMATICA}/Probabilità", "content/theory/math-for-ml/Probabilità"),
+    (f"{MATEMATICA}/Statistica", "content/theory/math-for-ml/Statistica"),
+    (f"{MATEMATICA}/Ottimizzazione", "content/theory/math-for-ml/Ottimizzazione"),
+    ("images", "static/images/posts"),
+]
+
+# Directory il cui contenuto è interamente gestito dalla sincronizzazione
+MANAGED_DIRS = [
+    "content/theory/introduction",
+    "content/theory/supervised-learning",
+    "content/theory/unsupervised-learning",
+    "content/theory/math-for-ml",
+    "content/theory/deep-learning",
+    "content/theory/computer-vision",
+    "content/theory/nlp",
+    "content/theory/reinforcement-learning",
+    "content/theory/generative-models",
+    "static/images/posts",
+]
+
+# File scritti accanto ai sorgenti da altri passi del build (varianti
+# precompresse di static_files.py e i loro .tmp): seguono il file da cui
+# derivano e si cancellano solo insieme a lui
+DERIVED_SUFFIXES = (".gz", ".br", ".tmp")
+
+
+def _sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _walk_files(root):
+    for dirpath, dirnames, files in os.walk(root):
+        # Metadati di Obsidian, .DS_Store & co.
+        dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+        for f in files:
+            if not f.startswith("."):
+                yield os.path.join(dirpath, f)
+
+
+def _load_json(path, default):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def _save_json(path, data):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(f"{path}.tmp", path)
+
+
+def plan(vault=VAULT_DIR, manifest=None):
+    """
+    Calcola cosa copiare e cosa cancellare.
+    Restituisce (sorgenti desiderate {dest: (src, sha)}, changelog).
+    """
+    manifest = manifest if manifest is not None else {}
+    desired = {}
+    for src_root, dest_root in SYNC_MAP:
+        src_root = os.path.join(vault, src_root)
+        if not os.path.isdir(src_root):
+            continue
+        for src in _walk_files(src_root):
+            rel = os.path.relpath(src, src_root)
+            dest = os.path.join(dest_root, rel).replace("\\", "/")
+            desired[dest] = (src, _sha256(src))
+
+    changes = []
+    for dest, (src, sha) in sorted(desired.items()):
+        if not os.path.exists(dest):
+            changes.append({"path": dest, "action": "added"})
+        else:
+            known = manifest.get(dest)
+            if known is None:
+                known = _sha256(dest)
+            if known != sha:
+                changes.append({"path": dest, "action": "modified"})
+
+    for managed in MANAGED_DIRS:
+        if not os.path.isdir(managed):
+            continue
+        for path in _walk_files(managed):
+            path = path.replace("\\", "/")
+            base, ext = os.path.splitext(path)
+            if ext in DERIVED_SUFFIXES and base in desired:
+                continue
+            if path not in desired:
+                changes.append({"path": path, "action": "deleted"})
+    return desired, changes
+
+
+def apply(desired, changes):
+    """
+    Copia in staging tutti i file da aggiornare e poi li sposta al loro
+    posto; infine rimuove i file cancellati dal vault.
+    """
+    shutil.rmtree(STAGING_DIR, ignore_errors=True)
+    staged = []
+    for change in changes:
+        if change["action"] == "deleted":
+            continue
+        dest = change["path"]
+        staging = os.path.join(STAGING_DIR, dest)
+        os.makedirs(os.path.dirname(staging), exist_ok=True)
+        shutil.copy2(desired[dest][0], staging)
+        staged.append((staging, dest))
+
+    for staging, dest in staged:
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        os.replace(staging, dest)
+
+    for change in changes:
+        if change["action"] == "deleted":
+            try:
+                os.remove(change["path"])
+            except FileNotFoundError:
+                pass
+    _remove_empty_dirs()
+    shutil.rmtree(STAGING_DIR, ignore_errors=True)
+
+
+def _remove_empty_dirs():
+    for managed in MANAGED_DIRS:
+        for dirpath, _, _ in sorted(os.walk(managed), key=lambda w: -len(w[0])):
+            if dirpath != managed and not os.listdir(dirpath):
+                os.rmdir(dirpath)
+
+
+def sync(vault=VAULT_DIR, dry_run=False, manifest_path=SYNC_MANIFEST, changelog_path=SYNC_CHANGELOG):
+    manifest = _load_json(manifest_path, {})
+    desired, changes = plan(vault, manifest)
+    if dry_run:
+        return changes
+
+    apply(desired, changes)
+    _save_json(manifest_path, {dest: sha for dest, (_, sha) in desired.items()})
+    _save_json(changelog_path, {
+        "synced_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "vault": vault,
+        "changes": changes,
+    })
+    return changes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Incrementally sync the Obsidian vault into content/theory")
+    parser.add_argument("--vault", default=VAULT_DIR, help="path to the Obsidian vault")
+    parser.add_argument("--dry-run", action="store_true", help="only print what would change")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.vault):
+        print(f"Vault not found: {args.vault}")
+        sys.exit(1)
+
+    changes = sync(args.vault, dry_run=args.dry_run)
+    for change in changes:
+        print(f"{change['action']:>8}  {change['path']}")
+    print(f"{len(changes)} paths changed" + (" (dry run)" if args.dry_run else ""))
@@ -1,10 +1,10 @@
 
 from fastapi import APIRouter, Depends, HTTPException, status
 from models import ContentView, UserInDB
-from database import db
+from analytics import view_buffer
 from auth import get_current_user
 from typing import Optional
-import datetime
+from datetime import datetime
 
 router = APIRouter(tags=["content_views"])
 
@@ -25,6 +25,6 @@ async def record_content_view(
     if current_user:
         view_data["user_id"] = str(current_user.id)
     
-    await db["content_views"].insert_one(view_data)
+    view_buffer.record(view_data)
     
     return {"message": "View recorded successfully"}
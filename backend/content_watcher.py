@@ -0,0 +1,194 @@
+"""
+Watcher opzionale dei contenuti sotto CONTENT_DIR.
+
+Con CONTENT_WATCHER=auto usa inotify tramite watchdog (se installato),
+altrimenti, o con CONTENT_WATCHER=poll, confronta ogni
+CONTENT_WATCH_INTERVAL secondi uno snapshot (mtime, size) dei file.
+
+Per ogni giro aggiorna solo quello che è cambiato:
+- note modificate: la voce in cache viene rifatta subito (se c'era);
+- note aggiunte o rimosse: link_index e albero delle directory vengono
+  ricostruiti, e vengono ri-renderizzate solo le pagine in cache i cui
+  link [[...]] ora puntano altrove.
+"""
+import os
+import asyncio
+import logging
+import threading
+
+from markdown_utils import CONTENT_DIR, link_index, get_directory_tree
+from content_cache import page_cache, get_rendered_page_async
+from executors import io_executor
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:  # watchdog è opzionale: si ripiega sul polling
+    Observer = None
+    FileSystemEventHandler = object
+
+logger = logging.getLogger(__name__)
+
+# "off" (default), "auto" (inotify se disponibile, altrimenti polling) o "poll"
+CONTENT_WATCHER = os.getenv("CONTENT_WATCHER", "off").lower()
+CONTENT_WATCH_INTERVAL = float(os.getenv("CONTENT_WATCH_INTERVAL", "2"))
+
+
+def snapshot(root):
+    files = {}
+    for dirpath, _, filenames in os.walk(root):
+        for f in filenames:
+            path = os.path.normpath(os.path.join(dirpath, f))
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            files[path] = (st.st_mtime_ns, st.st_size)
+    return files
+
+
+class _EventCollector(FileSystemEventHandler):
+    """Accumula i percorsi segnalati da inotify fino al prossimo giro."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.paths = set()
+        self.rescan = False
+
+    def on_any_event(self, event):
+        with self.lock:
+            if event.is_directory:
+                # Spostamenti/cancellazioni di cartelle: si rifà lo snapshot
+                self.rescan = True
+                return
+            for path in (event.src_path, getattr(event, "dest_path", None)):
+                if path:
+                    self.paths.add(os.path.normpath(os.path.relpath(path)))
+
+    def drain(self):
+        with self.lock:
+            paths, rescan = self.paths, self.rescan
+            self.paths, self.rescan = set(), False
+        return paths, rescan
+
+
+class ContentWatcher:
+    def __init__(self, content_dir=CONTENT_DIR, mode=CONTENT_WATCHER, interval=CONTENT_WATCH_INTERVAL):
+        self.content_dir = content_dir
+        self.mode = mode
+        self.interval = interval
+        self._snapshot = {}
+        self._task = None
+        self._observer = None
+        self._events = None
+
+    async def start(self):
+        if self.mode not in ("auto", "poll") or self._task is not None:
+            return
+        self._snapshot = await io_executor.run(snapshot, self.content_dir)
+        if self.mode == "auto" and Observer is not None:
+            self._events = _EventCollector()
+            self._observer = Observer()
+            self._observer.schedule(self._events, self.content_dir, recursive=True)
+            self._observer.start()
+            logger.info(f"Watching {self.content_dir} with inotify")
+        else:
+            logger.info(f"Watching {self.content_dir} by polling every {self.interval}s")
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer = None
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                modified, added, removed = await io_executor.run(self.collect)
+                if modified or added or removed:
+                    await self.apply(modified, added, removed)
+            except Exception as e:
+                logger.warning(f"Content watcher error: {e}")
+
+    def _diff(self, paths=None):
+        """Confronta lo snapshot con il disco (tutto, o solo i percorsi dati)."""
+        old = self._snapshot
+        if paths is None:
+            new = snapshot(self.content_dir)
+            candidates = old.keys() | new.keys()
+        else:
+            new = dict(old)
+            candidates = paths
+            for path in paths:
+                try:
+                    st = os.stat(path)
+                    new[path] = (st.st_mtime_ns, st.st_size)
+                except OSError:
+                    new.pop(path, None)
+
+        modified, added, removed = [], [], []
+        for path in candidates:
+            if path in new and path not in old:
+                added.append(path)
+            elif path in old and path not in new:
+                removed.append(path)
+            elif path in new and new[path] != old[path]:
+                modified.append(path)
+        self._snapshot = new
+        return modified, added, removed
+
+    def collect(self):
+        """Restituisce (modificati, aggiunti, rimossi) dall'ultimo giro."""
+        if self._events is not None:
+            paths, rescan = self._events.drain()
+            if not paths and not rescan:
+                return [], [], []
+            return self._diff(None if rescan else paths)
+        return self._diff()
+
+    def invalidate(self, modified, added, removed):
+        """
+        Invalida quello che è cambiato e restituisce le pagine in cache da
+        rifare subito (quelle lette di recente); le altre saranno
+        renderizzate alla prima richiesta.
+        """
+        for path in removed:
+            page_cache.invalidate(path)
+
+        stale = {path for path in modified if path.endswith(".md") and path in page_cache}
+        if added or removed:
+            link_index.refresh(force=True)
+            get_directory_tree()
+            stale.update(page_cache.stale_link_paths())
+        for path in stale:
+            page_cache.invalidate(path)
+        return sorted(stale)
+
+    async def apply(self, modified, added, removed):
+        stale = await io_executor.run(self.invalidate, modified, added, removed)
+        # Il rendering passa dal pool di rendering (thread o processi)
+        results = await asyncio.gather(
+            *(get_rendered_page_async(path) for path in stale), return_exceptions=True
+        )
+        refreshed = 0
+        for path, result in zip(stale, results):
+            if isinstance(result, Exception):
+                logger.warning(f"Could not re-render {path}: {result}")
+            else:
+                refreshed += 1
+
+        logger.info(
+            f"Content changed: {len(modified)} modified, {len(added)} added, "
+            f"{len(removed)} removed; {refreshed} cached pages re-rendered"
+        )
+
+
+content_watcher = ContentWatcher()
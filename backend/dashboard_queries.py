@@ -0,0 +1,273 @@
+"""
+Query della dashboard di amministrazione.
+
+Invece di una count_documents alla volta (una per giorno del mese) i
+conteggi di una finestra temporale e la serie raggruppata con $dateTrunc
+escono da una sola aggregazione $facet. Le sotto-pipeline di $facet non
+usano indici, quindi ogni $facet parte da un $match sulla finestra (che
+usa l'indice sul campo data) e i totali di sempre restano fuori:
+estimated_document_count per le collection intere, count_documents per
+i filtri. Tutte le query partono insieme con asyncio.gather, quindi la
+latenza è quella della più lenta e non la somma dei round trip.
+
+Se i contatori di stats_rollup sono disponibili, serie e totali per
+periodo si leggono da lì e su content_views resta solo la parte che
+richiede i documenti (contenuti più visti e più recenti).
+"""
+import os
+import asyncio
+from datetime import datetime, timedelta
+
+from models import (
+    UserStats, ContentStats, InteractionStats, FeedbackStats, AdminDashboardStats,
+)
+from stats_rollup import rollups_ready, load_buckets, window_total
+from executors import io_executor
+
+TIME_RANGES = ["today", "week", "month", "6months", "year", "all"]
+FIRST_YEAR = 2022
+
+
+def _add_months(ts, months):
+    index = ts.year * 12 + ts.month - 1 + months
+    return ts.replace(year=index // 12, month=index % 12 + 1, day=1)
+
+
+class PeriodSpec:
+    """
+    Periodo mostrato dalla dashboard: inizio, etichette dell'asse x, unità
+    per $dateTrunc, granularità dei contatori e funzione che assegna un
+    istante (o l'inizio di un intervallo) alla sua etichetta.
+    """
+
+    def __init__(self, time_range, now):
+        self.time_range = time_range
+        self.now = now
+        today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+
+        if time_range == "today":
+            # Fasce di 6 ore, solo quelle già iniziate
+            self.start = today
+            self.labels = [f"{h:02d}:00" for h in (0, 6, 12, 18) if h <= now.hour]
+            self.unit, self.granularity = "hour", "hour"
+        elif time_range == "week":
+            self.start = now - timedelta(days=7)
+            self.labels = [(now - timedelta(days=i)).strftime("%a") for i in range(6, -1, -1)]
+            self.unit, self.granularity = "day", "hour"
+        elif time_range == "month":
+            self.start = today.replace(day=1)
+            self.labels = [f"{day:02d}" for day in range(1, now.day + 1)]
+            self.unit, self.granularity = "day", "day"
+        elif time_range in ("6months", "year"):
+            months = 6 if time_range == "6months" else 12
+            self.start = now - timedelta(days=180 if months == 6 else 365)
+            # Mesi di calendario, chiave (anno, mese): il mese di un anno
+            # fa non finisce sotto l'etichetta del mese corrente
+            self._months = {
+                (m.year, m.month): m.strftime("%b")
+                for m in (_add_months(today, -i) for i in range(months - 1, -1, -1))
+            }
+            self.labels = list(self._months.values())
+            self.unit, self.granularity = "month", "day"
+        else:  # "all"
+            self.start = datetime(FIRST_YEAR, 1, 1)
+            self.labels = [str(year) for year in range(FIRST_YEAR, now.year + 1)]
+            self.unit, self.granularity = "year", "month"
+
+    def label(self, ts):
+        if self.time_range == "today":
+            return f"{ts.hour // 6 * 6:02d}:00"
+        if self.time_range == "week":
+            return ts.strftime("%a")
+        if self.time_range == "month":
+            return ts.strftime("%d")
+        if self.time_range in ("6months", "year"):
+            return self._months.get((ts.year, ts.month))
+        return str(ts.year)
+
+    def series(self, buckets, key):
+        """{istante: conteggio} -> [{"name": etichetta, key: conteggio}] in ordine."""
+        data = {label: 0 for label in self.labels}
+        for ts, count in buckets.items():
+            label = self.label(ts)
+            if label in data:
+                data[label] += count
+        return [{"name": label, key: count} for label, count in data.items()]
+
+
+def _count(match=None):
+    return ([{"$match": match}] if match else []) + [{"$count": "n"}]
+
+
+def _series(field, spec):
+    return [
+        {"$match": {field: {"$gte": spec.start, "$lte": spec.now}}},
+        {"$group": {"_id": {"$dateTrunc": {"date": f"${field}", "unit": spec.unit}}, "count": {"$sum": 1}}},
+    ]
+
+
+async def _window_facet(db, collection, field, since, until, facets):
+    """$facet sui soli documenti con field in [since, until]."""
+    result = await db[collection].aggregate([
+        {"$match": {field: {"$gte": since, "$lte": until}}},
+        {"$facet": facets},
+    ]).to_list(1)
+    return result[0] if result else {name: [] for name in facets}
+
+
+async def _aggregate(db, collection, pipeline):
+    return await db[collection].aggregate(pipeline).to_list(None)
+
+
+async def _none():
+    return None
+
+
+def _n(rows):
+    return rows[0]["n"] if rows else 0
+
+
+def _buckets(rows):
+    return {row["_id"]: row["count"] for row in rows if row["_id"] is not None}
+
+
+def _content_count():
+    # Conta tutti i file .md in content/theory/
+    return sum(
+        1 for _, _, files in os.walk("content/theory/")
+        for f in files if f.endswith(".md")
+    )
+
+
+TOP_CONTENT = [
+    {"$group": {
+        "_id": {"content_id": "$content_id", "content_title": "$content_title", "content_type": "$content_type"},
+        "views": {"$sum": 1}
+    }},
+    {"$sort": {"views": -1}},
+    {"$limit": 5},
+    {"$project": {
+        "_id": 0,
+        "content_id": "$_id.content_id",
+        "title": "$_id.content_title",
+        "type": "$_id.content_type",
+        "views": 1
+    }}
+]
+
+# Fuori da $facet il $sort iniziale usa l'indice su viewed_at
+RECENT_CONTENT = [
+    {"$sort": {"viewed_at": -1}},
+    {"$group": {
+        "_id": {"content_id": "$content_id", "content_title": "$content_title", "content_type": "$content_type"},
+        "last_viewed": {"$first": "$viewed_at"}
+    }},
+    {"$sort": {"last_viewed": -1}},
+    {"$limit": 5},
+    {"$project": {
+        "_id": 0,
+        "content_id": "$_id.content_id",
+        "title": "$_id.content_title",
+        "type": "$_id.content_type",
+        "last_viewed": 1
+    }}
+]
+
+
+async def _rollup_stats(db, spec):
+    week_ago, month_ago = spec.now - timedelta(days=7), spec.now - timedelta(days=30)
+    (logins, views, active_7, active_30, total_views, weekly_views, monthly_views) = await asyncio.gather(
+        load_buckets(db, "logins", spec.granularity, spec.start),
+        load_buckets(db, "views", spec.granularity, spec.start),
+        window_total(db, "logins", "hour", week_ago),
+        window_total(db, "logins", "day", month_ago),
+        window_total(db, "views", "month"),
+        window_total(db, "views", "hour", week_ago),
+        window_total(db, "views", "day", month_ago),
+    )
+    return {
+        "logins": logins, "views": views,
+        "active_7": active_7, "active_30": active_30,
+        "total_views": total_views, "weekly_views": weekly_views, "monthly_views": monthly_views,
+    }
+
+
+async def build_dashboard(db, time_range, now=None):
+    now = now or datetime.utcnow()
+    spec = PeriodSpec(time_range, now)
+    week_ago, month_ago = now - timedelta(days=7), now - timedelta(days=30)
+    use_rollups = await rollups_ready(db)
+
+    # La finestra più ampia fra il periodo del grafico e gli ultimi 30 giorni
+    since = min(spec.start, month_ago)
+    users_col, views_col, feedback_col = db["users"], db["content_views"], db["feedback"]
+
+    (
+        total_users, active_users, new_weekly, admins,
+        total_feedback, unresolved_feedback, recent_feedback,
+        top_content, recent_content, total_views, logins, views,
+        content_count, rollups,
+    ) = await asyncio.gather(
+        users_col.estimated_document_count(),
+        users_col.count_documents({"is_active": True}),
+        users_col.count_documents({"created_at": {"$gte": week_ago}}),
+        users_col.count_documents({"role": "admin"}),
+        feedback_col.estimated_document_count(),
+        feedback_col.count_documents({"resolved": False}),
+        feedback_col.count_documents({"created_at": {"$gte": week_ago}}),
+        _aggregate(db, "content_views", TOP_CONTENT),
+        _aggregate(db, "content_views", RECENT_CONTENT),
+        _none() if use_rollups else views_col.estimated_document_count(),
+        _none() if use_rollups else _window_facet(db, "users", "last_login", since, now, {
+            "active_7": _count({"last_login": {"$gte": week_ago}}),
+            "active_30": _count({"last_login": {"$gte": month_ago}}),
+            "series": _series("last_login", spec),
+        }),
+        _none() if use_rollups else _window_facet(db, "content_views", "viewed_at", since, now, {
+            "weekly": _count({"viewed_at": {"$gte": week_ago}}),
+            "monthly": _count({"viewed_at": {"$gte": month_ago}}),
+            "series": _series("viewed_at", spec),
+        }),
+        io_executor.run(_content_count),
+        _rollup_stats(db, spec) if use_rollups else _none(),
+    )
+
+    if use_rollups:
+        active_7, active_30 = rollups["active_7"], rollups["active_30"]
+        total_views, weekly_views, monthly_views = (
+            rollups["total_views"], rollups["weekly_views"], rollups["monthly_views"]
+        )
+        login_buckets, view_buckets = rollups["logins"], rollups["views"]
+    else:
+        active_7, active_30 = _n(logins["active_7"]), _n(logins["active_30"])
+        weekly_views, monthly_views = _n(views["weekly"]), _n(views["monthly"])
+        login_buckets, view_buckets = _buckets(logins["series"]), _buckets(views["series"])
+
+    return AdminDashboardStats(
+        user_stats=UserStats(
+            total_users=total_users,
+            active_users=active_users,
+            new_users_weekly=new_weekly,
+            active_users_7days=active_7,
+            active_users_30days=active_30,
+            admin_count=admins,
+        ),
+        content_stats=ContentStats(
+            total_content=content_count,
+            top_content=top_content,
+            recent_content=recent_content,
+        ),
+        interaction_stats=InteractionStats(
+            total_views=total_views,
+            weekly_views=weekly_views,
+            monthly_views=monthly_views,
+            average_views=(total_views / content_count) if content_count > 0 else 0,
+        ),
+        feedback_stats=FeedbackStats(
+            total_feedback=total_feedback,
+            unresolved_feedback=unresolved_feedback,
+            recent_feedback=recent_feedback,
+        ),
+        user_activity_data=spec.series(login_buckets, "users"),
+        content_views_data=spec.series(view_buckets, "views"),
+    )
@@ -1,15 +1,166 @@
+"""
+Client MongoDB condiviso e ciclo di vita delle connessioni.
 
+Il client si crea all'import (i moduli usano `from database import db`),
+ma non apre connessioni finché non serve: connect(), chiamata dal
+lifespan di main.py, apre subito MONGO_WARMUP_CONNECTIONS connessioni con
+dei ping in parallelo, così ogni worker uvicorn parte con il pool già
+caldo; close() lo chiude allo shutdown.
+
+Il pool è per processo: con N worker uvicorn le connessioni verso Mongo
+arrivano fino a N * MONGO_MAX_POOL_SIZE. Le dimensioni e i timeout si
+configurano da env; le statistiche del pool (connessioni in uso, attesa
+per ottenerne una) finiscono in /admin/metrics.
+"""
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring
 import os
+import time
+import asyncio
+import logging
+import threading
 from dotenv import load_dotenv
 
+from metrics import metrics
+
 # Load environment variables
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # MongoDB connection settings
 MONGODB_URI = os.getenv("MONGODB_URI", "mongodb://localhost:27017")
 DATABASE_NAME = os.getenv("DATABASE_NAME", "ml_academy")
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "5"))
+MONGO_WARMUP_CONNECTIONS = int(os.getenv("MONGO_WARMUP_CONNECTIONS", str(MONGO_MIN_POOL_SIZE)))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+# 0 = nessun timeout, come prima: aggregazioni della dashboard, backfill
+# dei contatori e build degli indici possono durare a lungo
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "0"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "5000"))
+
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """
+    Conta le connessioni aperte e in uso e misura l'attesa per ottenerne
+    una. pymongo chiama i listener in modo sincrono dal thread che fa il
+    checkout, quindi l'inizio dell'attesa si tiene in un threading.local.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.open = 0
+        self.checked_out = 0
+        self.waiting = 0
+        self.max_checked_out = 0
+        self.failed = 0
+
+    def _begin_wait(self):
+        self._local.started = time.perf_counter()
+        with self._lock:
+            self.waiting += 1
+
+    def _end_wait(self):
+        started = getattr(self._local, "started", None)
+        self._local.started = None
+        with self._lock:
+            self.waiting = max(self.waiting - 1, 0)
+        if started is not None:
+            metrics.observe("mongo.checkout_wait", time.perf_counter() - started)
+
+    def connection_check_out_started(self, event):
+        self._begin_wait()
+
+    def connection_checked_out(self, event):
+        self._end_wait()
+        with self._lock:
+            self.checked_out += 1
+            self.max_checked_out = max(self.max_checked_out, self.checked_out)
+
+    def connection_check_out_failed(self, event):
+        self._end_wait()
+        with self._lock:
+            self.failed += 1
+        metrics.incr(f"mongo.checkout_failed.{event.reason}")
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out = max(self.checked_out - 1, 0)
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open += 1
 
-# Initialize database connection
-client = AsyncIOMotorClient(MONGODB_URI)
+    def connection_closed(self, event):
+        with self._lock:
+            self.open = max(self.open - 1, 0)
+
+    def connection_ready(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        metrics.incr("mongo.pool_cleared")
+
+    def pool_closed(self, event):
+        pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_pool_size": MONGO_MAX_POOL_SIZE,
+                "min_pool_size": MONGO_MIN_POOL_SIZE,
+                "open": self.open,
+                "checked_out": self.checked_out,
+                "max_checked_out": self.max_checked_out,
+                "waiting": self.waiting,
+                "checkout_failed": self.failed,
+            }
+
+
+pool_monitor = PoolMonitor()
+
+# Initialize database connection (lazy: nessuna connessione fino al primo uso)
+client = AsyncIOMotorClient(
+    MONGODB_URI,
+    maxPoolSize=MONGO_MAX_POOL_SIZE,
+    minPoolSize=MONGO_MIN_POOL_SIZE,
+    serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+    socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS or None,
+    waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+    event_listeners=[pool_monitor],
+)
 db = client[DATABASE_NAME]
+
+
+async def connect():
+    """
+    Verifica la connessione e riscalda il pool con ping in parallelo
+    (ognuno tiene occupata una connessione, quindi ne apre una nuova).
+    Se Mongo non risponde logga e lascia partire l'app comunque.
+    """
+    warmup = max(min(MONGO_WARMUP_CONNECTIONS, MONGO_MAX_POOL_SIZE), 1)
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(client.admin.command("ping") for _ in range(warmup)))
+    except Exception as e:
+        logger.warning(f"MongoDB warm-up failed: {e}")
+        return False
+    logger.info(
+        f"MongoDB pool warmed: {pool_monitor.open} connections "
+        f"in {time.perf_counter() - started:.3f}s"
+    )
+    return True
+
+
+def close():
+    client.close()
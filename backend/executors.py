@@ -0,0 +1,155 @@
+"""
+Executor limitati per il lavoro bloccante, da usare dalle route async.
+
+Le route sono async e girano tutte sullo stesso event loop: un open()/read()
+sincrono o un rendering Markdown+Pygments inline bloccano anche le richieste
+di auth, leaderboard e admin servite dallo stesso worker. Questi executor
+spostano il lavoro su pool di thread dedicati, con un limite di richieste
+in volo per pool (le altre aspettano sul semaforo senza occupare thread).
+
+python-markdown e Pygments sono Python puro e tengono il GIL, quindi più
+thread di rendering non renderizzano più pagine insieme. Con
+RENDER_BACKEND=process il pool di rendering usa processi separati, già
+riscaldati all'avvio (markdown_utils.warm_renderer): in quel caso fn e
+argomenti devono essere picklabili e fn non vede lo stato del processo
+principale (cache comprese).
+
+    page, links, images = await render_executor.run(render_markdown_in_worker, text)
+"""
+import os
+import asyncio
+import time
+import functools
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from metrics import metrics
+
+# "thread" (default) o "process"
+RENDER_BACKEND = os.getenv("RENDER_BACKEND", "thread").lower()
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", "2"))
+RENDER_CONCURRENCY = int(os.getenv("RENDER_CONCURRENCY", str(RENDER_WORKERS)))
+IO_WORKERS = int(os.getenv("IO_WORKERS", "8"))
+IO_CONCURRENCY = int(os.getenv("IO_CONCURRENCY", str(IO_WORKERS * 4)))
+# bcrypt: pochi thread (è CPU pura) e una coda corta, oltre la quale si
+# rifiuta subito invece di accumulare login in attesa
+PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", "2"))
+PASSWORD_QUEUE_MAX = int(os.getenv("PASSWORD_QUEUE_MAX", "32"))
+
+
+class ExecutorBusy(Exception):
+    """La coda di un BoundedExecutor con max_queue è piena."""
+
+
+class BoundedExecutor:
+    def __init__(self, name, max_workers, max_concurrency=None, kind="thread", initializer=None,
+                 max_queue=None):
+        self.name = name
+        self.max_queue = max_queue
+        self.kind = kind
+        self.initializer = initializer
+        self.max_workers = max_workers
+        self.max_concurrency = max_concurrency or max_workers
+        self._executor = None
+        self._semaphore = None
+        self.in_flight = 0
+        self.waiting = 0
+
+    def _get_executor(self):
+        if self._executor is None:
+            if self.kind == "process":
+                # spawn: i worker non ereditano event loop, client Mongo e lock
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=self.initializer,
+                )
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix=self.name,
+                    initializer=self.initializer,
+                )
+        return self._executor
+
+    def start(self):
+        """
+        Crea subito il pool. Per i processi avvia anche tutti i worker (e
+        quindi l'initializer), così il primo burst non paga l'avvio.
+        """
+        executor = self._get_executor()
+        if self.kind == "process":
+            futures = [executor.submit(_noop) for _ in range(self.max_workers)]
+            return [f.result() for f in futures]
+
+    async def run(self, fn, *args, **kwargs):
+        """
+        Esegue fn(*args, **kwargs) nel pool e ne attende il risultato.
+        Solleva ExecutorBusy se ci sono già max_queue chiamate in attesa.
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        if self.max_queue is not None and self._semaphore.locked() and self.waiting >= self.max_queue:
+            metrics.incr(f"{self.name}.rejected")
+            raise ExecutorBusy(self.name)
+        queued_at = time.perf_counter()
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        started = time.perf_counter()
+        metrics.observe(f"{self.name}.queue_wait", started - queued_at)
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._get_executor(), functools.partial(fn, *args, **kwargs)
+            )
+        finally:
+            metrics.observe(f"{self.name}.run", time.perf_counter() - started)
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    def stats(self):
+        return {
+            "kind": self.kind,
+            "max_workers": self.max_workers,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+        }
+
+    def shutdown(self, wait=True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+
+def _noop():
+    return os.getpid()
+
+
+def _warm_renderer():
+    from markdown_utils import warm_renderer
+    warm_renderer()
+
+
+# Rendering Markdown (CPU) e I/O su disco hanno pool separati, così un
+# burst di rendering non ritarda le letture dalla cache
+render_executor = BoundedExecutor(
+    "render", RENDER_WORKERS, RENDER_CONCURRENCY,
+    kind="process" if RENDER_BACKEND == "process" else "thread",
+    initializer=_warm_renderer if RENDER_BACKEND == "process" else None,
+)
+io_executor = BoundedExecutor("io", IO_WORKERS, IO_CONCURRENCY)
+# Hash e verifica delle password: un burst di login rallenta solo i login
+password_executor = BoundedExecutor(
+    "password", PASSWORD_WORKERS, PASSWORD_WORKERS, max_queue=PASSWORD_QUEUE_MAX
+)
+
+
+def shutdown_executors():
+    render_executor.shutdown(wait=False)
+    io_executor.shutdown(wait=False)
+    password_executor.shutdown(wait=False)
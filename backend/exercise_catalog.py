@@ -0,0 +1,61 @@
+"""
+Mappa id esercizio -> difficoltà e numero totale di esercizi, in memoria.
+
+/users/me/progress faceva un find_one per ogni esercizio risolto più una
+count_documents su tutta la collection. Gli esercizi cambiano solo con
+POST /exercises/, quindi qui si caricano una volta (solo _id e
+difficulty) e si tengono per EXERCISE_CATALOG_TTL secondi; la creazione di
+un esercizio invalida la mappa. Gli id che non ci sono (es. esercizi
+creati da un altro worker) vengono cercati tutti insieme con un solo $in.
+"""
+import os
+import time
+import asyncio
+
+from bson import ObjectId
+
+EXERCISE_CATALOG_TTL = float(os.getenv("EXERCISE_CATALOG_TTL", "300"))
+
+
+class ExerciseCatalog:
+    def __init__(self, ttl=EXERCISE_CATALOG_TTL):
+        self.ttl = ttl
+        self._difficulty = {}
+        self._count = 0
+        self._expires = 0.0
+        self._lock = None
+
+    async def _ensure(self, db):
+        if time.monotonic() < self._expires:
+            return
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if time.monotonic() < self._expires:
+                return
+            docs = await db["exercises"].find({}, {"difficulty": 1}).to_list(None)
+            self._difficulty = {str(doc["_id"]): doc.get("difficulty") for doc in docs}
+            self._count = len(docs)
+            self._expires = time.monotonic() + self.ttl
+
+    async def count(self, db):
+        await self._ensure(db)
+        return self._count
+
+    async def difficulties(self, db, exercise_ids):
+        """Restituisce {id: difficoltà} per gli id dati (quelli esistenti)."""
+        await self._ensure(db)
+        missing = [i for i in exercise_ids if i not in self._difficulty and ObjectId.is_valid(i)]
+        if missing:
+            docs = await db["exercises"].find(
+                {"_id": {"$in": [ObjectId(i) for i in missing]}}, {"difficulty": 1}
+            ).to_list(None)
+            for doc in docs:
+                self._difficulty[str(doc["_id"])] = doc.get("difficulty")
+        return {i: self._difficulty[i] for i in exercise_ids if i in self._difficulty}
+
+    def invalidate(self):
+        self._expires = 0.0
+
+
+exercise_catalog = ExerciseCatalog()
@@ -0,0 +1,192 @@
+"""
+Indici MongoDB usati dalle route, dichiarati in un unico registro.
+
+    python indexes.py            # crea gli indici mancanti
+    python indexes.py --report   # explain delle query calde, segnala i COLLSCAN
+
+ensure_indexes() gira all'avvio dell'app ed è idempotente: un indice già
+presente con la stessa definizione non costa nulla. Gli errori (es.
+duplicati che impediscono un indice unique) vengono loggati senza fermare
+l'avvio.
+
+Con CONTENT_VIEWS_TTL_DAYS > 0 l'indice su content_views.viewed_at diventa
+un indice TTL e MongoDB cancella gli eventi più vecchi; i contatori della
+dashboard (stats_rollup) restano, le serie calcolate sui dati grezzi no.
+Rimettendolo a 0 l'indice viene ricreato senza TTL e gli eventi non
+scadono più.
+"""
+import sys
+import asyncio
+import logging
+import os
+from datetime import datetime
+
+from pymongo import IndexModel, ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+CONTENT_VIEWS_TTL_DAYS = int(os.getenv("CONTENT_VIEWS_TTL_DAYS", "0"))
+
+# Codici di MongoDB per "esiste già un indice con lo stesso nome/chiave ma
+# opzioni diverse"
+INDEX_OPTIONS_CONFLICT = (85, 86)
+
+
+def _viewed_at_index():
+    if CONTENT_VIEWS_TTL_DAYS > 0:
+        return IndexModel(
+            [("viewed_at", ASCENDING)], name="viewed_at",
+            expireAfterSeconds=CONTENT_VIEWS_TTL_DAYS * 86400,
+        )
+    return IndexModel([("viewed_at", ASCENDING)], name="viewed_at")
+
+
+INDEXES = {
+    "users": [
+        # get_user ad ogni richiesta autenticata, create_user
+        IndexModel([("username", ASCENDING)], name="username_unique", unique=True),
+        # google_callback, create_user
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+        # leaderboard
+        IndexModel([("points", DESCENDING)], name="points_desc"),
+        # dashboard
+        IndexModel([("last_login", ASCENDING)], name="last_login"),
+        IndexModel([("created_at", ASCENDING)], name="created_at"),
+    ],
+    "content_views": [
+        _viewed_at_index(),
+        IndexModel([("content_id", ASCENDING), ("viewed_at", DESCENDING)], name="content_id_viewed_at"),
+        # prewarm delle pagine più viste
+        IndexModel([("content_type", ASCENDING), ("content_id", ASCENDING)], name="content_type_content_id"),
+    ],
+    "course_contents": [
+        IndexModel([("course_id", ASCENDING)], name="course_id"),
+    ],
+    "feedback": [
+        IndexModel([("created_at", DESCENDING)], name="created_at"),
+        IndexModel([("resolved", ASCENDING), ("created_at", DESCENDING)], name="resolved_created_at"),
+    ],
+    "products": [
+        IndexModel([("id", ASCENDING)], name="id"),
+    ],
+    "stats_rollups": [
+        IndexModel([("metric", ASCENDING), ("granularity", ASCENDING), ("bucket", ASCENDING)], name="metric_bucket"),
+    ],
+}
+
+
+async def _ensure_index(db, collection, index):
+    spec = index.document
+    try:
+        await db[collection].create_indexes([index])
+        return True
+    except OperationFailure as e:
+        if e.code in INDEX_OPTIONS_CONFLICT and "expireAfterSeconds" in spec:
+            # Solo il TTL è cambiato: si aggiorna senza ricostruire l'indice
+            await db.command("collMod", collection, index={
+                "keyPattern": dict(spec["key"]),
+                "expireAfterSeconds": spec["expireAfterSeconds"],
+            })
+            return True
+        if e.code in INDEX_OPTIONS_CONFLICT and await _has_ttl(db, collection, spec["name"]):
+            # TTL tolto (CONTENT_VIEWS_TTL_DAYS=0): collMod non lo rimuove,
+            # si ricrea l'indice senza expireAfterSeconds
+            await db[collection].drop_index(spec["name"])
+            await db[collection].create_indexes([index])
+            logger.info(f"TTL removed from index {collection}.{spec['name']}: documents no longer expire")
+            return True
+        logger.warning(f"Could not create index {collection}.{spec['name']}: {e}")
+        return False
+
+
+async def _has_ttl(db, collection, name):
+    existing = await db[collection].index_information()
+    return "expireAfterSeconds" in existing.get(name, {})
+
+
+async def ensure_indexes(db):
+    """Crea gli indici del registro che mancano. Restituisce il numero di falliti."""
+    results = await asyncio.gather(*(
+        _ensure_index(db, collection, index)
+        for collection, indexes in INDEXES.items()
+        for index in indexes
+    ))
+    failed = results.count(False)
+    logger.info(f"Indexes ensured ({failed} failed)" if failed else "Indexes ensured")
+    return failed
+
+
+SINCE = datetime(2000, 1, 1)
+
+# Query rappresentative delle route: (route, collection, comando find o aggregate)
+HOT_QUERIES = [
+    ("get_user", "users", {"find": "users", "filter": {"username": "x"}}),
+    ("google_callback", "users", {"find": "users", "filter": {"email": "x@example.com"}}),
+    ("get_leaderboard", "users", {"find": "users", "filter": {}, "sort": {"points": -1}, "limit": 10}),
+    ("dashboard (last_login)", "users", {"find": "users", "filter": {"last_login": {"$gte": SINCE}}}),
+    ("dashboard (created_at)", "users", {"find": "users", "filter": {"created_at": {"$gte": SINCE}}}),
+    ("dashboard (viewed_at)", "content_views", {"find": "content_views", "filter": {"viewed_at": {"$gte": SINCE}}}),
+    ("prewarm top", "content_views", {"aggregate": "content_views", "pipeline": [
+        {"$match": {"content_type": "theory"}},
+        {"$group": {"_id": "$content_id", "views": {"$sum": 1}}},
+    ], "cursor": {}}),
+    ("get_course_content", "course_contents", {"find": "course_contents", "filter": {"course_id": "x"}}),
+    ("get_feedback", "feedback", {"find": "feedback", "filter": {"resolved": False}, "sort": {"created_at": -1}}),
+    ("get_product", "products", {"find": "products", "filter": {"id": "x"}}),
+    ("dashboard rollups", "stats_rollups", {"find": "stats_rollups", "filter": {
+        "metric": "views", "granularity": "day", "bucket": {"$gte": SINCE},
+    }}),
+]
+
+
+def _stages(plan):
+    stages = [plan.get("stage")]
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            stages += _stages(plan[key])
+    for child in plan.get("inputStages", []):
+        stages += _stages(child)
+    return [s for s in stages if s]
+
+
+def _winning_plan(explain):
+    if "queryPlanner" in explain:
+        return explain["queryPlanner"]["winningPlan"]
+    for stage in explain.get("stages", []):
+        if "$cursor" in stage:
+            return stage["$cursor"]["queryPlanner"]["winningPlan"]
+    return {}
+
+
+async def report(db):
+    """Restituisce [(route, collection, stadi del piano, collscan)] per HOT_QUERIES."""
+    rows = []
+    for route, collection, command in HOT_QUERIES:
+        explain = await db.command("explain", command, verbosity="queryPlanner")
+        stages = _stages(_winning_plan(explain))
+        rows.append((route, collection, stages, "COLLSCAN" in stages))
+    return rows
+
+
+async def _main(args):
+    from database import db
+    if args.report:
+        rows = await report(db)
+        for route, collection, stages, collscan in rows:
+            flag = "COLLSCAN" if collscan else "ok"
+            print(f"{flag:>8}  {route:<24} {collection:<16} {' <- '.join(stages)}")
+        scans = sum(1 for row in rows if row[3])
+        print(f"{scans} of {len(rows)} queries scan the whole collection")
+        return 1 if scans else 0
+    return 1 if await ensure_indexes(db) else 0
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Create the MongoDB indexes or report collection scans")
+    parser.add_argument("--report", action="store_true", help="explain the hot queries and list collection scans")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    sys.exit(asyncio.run(_main(args)))
@@ -0,0 +1,156 @@
+"""
+Classifica mantenuta in memoria.
+
+GET /leaderboard/ ordinava tutta la collection users per points ad ogni
+chiamata. Qui la classifica è una lista ordinata di chiavi
+(-punti, username), caricata una volta da Mongo e poi aggiornata da
+submit_solution e dalla creazione di nuovi utenti, che conoscono già i
+nuovi punti. Pagine e rank di un utente si leggono con bisect, senza sort.
+
+Ogni LEADERBOARD_RESYNC_INTERVAL secondi la classifica viene ricaricata
+da Mongo: con più worker uvicorn è così che ognuno vede i punti
+assegnati dagli altri (e le modifiche fatte direttamente sul database).
+"""
+import os
+import asyncio
+import logging
+from bisect import bisect_left, insort
+
+logger = logging.getLogger(__name__)
+
+LEADERBOARD_RESYNC_INTERVAL = float(os.getenv("LEADERBOARD_RESYNC_INTERVAL", "300"))
+
+
+def achievements(points, problems_solved):
+    result = []
+    if points > 5000:
+        result.append("Expert")
+    elif points > 2000:
+        result.append("Intermediate")
+    else:
+        result.append("Beginner")
+
+    if problems_solved > 20:
+        result.append("Problem Solver")
+    return result
+
+
+class Leaderboard:
+    def __init__(self, resync_interval=LEADERBOARD_RESYNC_INTERVAL):
+        self.resync_interval = resync_interval
+        self._keys = []       # (-punti, username), ordinata
+        self._users = {}      # username -> (punti, esercizi risolti)
+        self._loaded = False
+        self._pending = None  # aggiornamenti arrivati durante un load()
+        # Un solo load alla volta (resync periodico e primo ensure_loaded):
+        # _pending è condiviso e non devono sovrapporsi
+        self._load_lock = asyncio.Lock()
+        self._task = None
+
+    async def load(self, db):
+        """Ricarica tutta la classifica da Mongo (solo i campi che servono)."""
+        async with self._load_lock:
+            await self._load(db)
+
+    async def _load(self, db):
+        self._pending = {}
+        try:
+            rows = await self._fetch(db)
+        except Exception:
+            self._pending = None
+            raise
+        users = {row["username"]: (row["points"], row["solved"]) for row in rows if row.get("username")}
+        # Gli update arrivati mentre la query era in corso potrebbero non
+        # essere nella lettura: vincono loro
+        users.update(self._pending)
+        self._pending = None
+        self._users = users
+        self._keys = sorted((-points, username) for username, (points, _) in users.items())
+        self._loaded = True
+
+    async def _fetch(self, db):
+        return await db["users"].aggregate([
+            {"$project": {
+                "_id": 0,
+                "username": 1,
+                "points": {"$ifNull": ["$points", 0]},
+                "solved": {"$size": {"$ifNull": ["$solved_exercises", []]}},
+            }},
+        ]).to_list(None)
+
+    async def ensure_loaded(self, db):
+        if self._loaded:
+            return
+        async with self._load_lock:
+            if not self._loaded:
+                await self._load(db)
+
+    def update(self, username, points, problems_solved):
+        """Imposta punti ed esercizi risolti di un utente (nuovo o esistente)."""
+        if self._pending is not None:
+            self._pending[username] = (points, problems_solved)
+        if not self._loaded:
+            return  # verrà letto dal primo load
+        old = self._users.get(username)
+        if old is not None:
+            index = bisect_left(self._keys, (-old[0], username))
+            if index < len(self._keys) and self._keys[index] == (-old[0], username):
+                del self._keys[index]
+        self._users[username] = (points, problems_solved)
+        insort(self._keys, (-points, username))
+
+    def remove(self, username):
+        old = self._users.pop(username, None)
+        if old is not None:
+            index = bisect_left(self._keys, (-old[0], username))
+            if index < len(self._keys) and self._keys[index] == (-old[0], username):
+                del self._keys[index]
+
+    def entry(self, username):
+        points, solved = self._users[username]
+        return {
+            "username": username,
+            "score": points,
+            "problems_solved": solved,
+            "achievements": achievements(points, solved),
+        }
+
+    def page(self, offset=0, limit=10):
+        return [self.entry(username) for _, username in self._keys[offset:offset + limit]]
+
+    def rank(self, username):
+        """
+        Posizione dell'utente (1 = primo; a pari punti stesso rank) oppure
+        None se l'utente non è in classifica.
+        """
+        user = self._users.get(username)
+        if user is None:
+            return None
+        return bisect_left(self._keys, (-user[0], "")) + 1
+
+    def __len__(self):
+        return len(self._keys)
+
+    async def start(self, db):
+        if self._task is None and self.resync_interval > 0:
+            self._task = asyncio.create_task(self._run(db))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self, db):
+        while True:
+            try:
+                await self.load(db)
+            except Exception as e:
+                logger.warning(f"Leaderboard resync failed: {e}")
+            await asyncio.sleep(self.resync_interval)
+
+
+leaderboard = Leaderboard()
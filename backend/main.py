@@ -1,16 +1,77 @@
 
 from fastapi import FastAPI
+from contextlib import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 import os
+import asyncio
+import logging
 from routes import router as main_router
 from admin_routes import router as admin_router
 from contact_routes import router as contact_router
 from content_view_routes import router as content_view_router
-from database import client
+import database
+from database import client, db
+from content_cache import prewarm_from_config
+from content_watcher import content_watcher
+from analytics import view_buffer
+from indexes import ensure_indexes
+from oidc import close_client
+from leaderboard import leaderboard
+from pagination import NEXT_CURSOR_HEADER
+from compression import CompressionMiddleware
+from static_files import PrecompressedStaticFiles
+from executors import io_executor, render_executor, shutdown_executors
+
+logger = logging.getLogger(__name__)
+
+
+def _log_prewarm_result(task):
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning(f"Theory cache prewarm failed: {task.exception()!r}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.mongodb_client = client
+    # Pool Mongo già caldo prima di accettare richieste (vedi database.py)
+    await database.connect()
+    # Indici delle query calde (idempotente, vedi indexes.py)
+    try:
+        await ensure_indexes(db)
+    except Exception as e:
+        logger.warning(f"Could not ensure indexes: {e}")
+    # Scrittura in batch delle visualizzazioni (content_views)
+    await view_buffer.start(db)
+    # Classifica in memoria, ricaricata periodicamente da Mongo
+    await leaderboard.start(db)
+    # Con RENDER_BACKEND=process avvia e riscalda subito i worker di rendering
+    await io_executor.run(render_executor.start)
+    # Pre-riscaldamento opzionale della cache delle pagine di teoria
+    prewarm_task = asyncio.create_task(prewarm_from_config(db))
+    prewarm_task.add_done_callback(_log_prewarm_result)
+    # Watcher opzionale dei contenuti (CONTENT_WATCHER=auto|poll)
+    await content_watcher.start()
+
+    yield
+
+    # Un prewarm ancora in corso non deve usare executor e client già chiusi
+    prewarm_task.cancel()
+    try:
+        await prewarm_task
+    except asyncio.CancelledError:
+        pass
+    except Exception:
+        pass  # già loggato da _log_prewarm_result
+    await content_watcher.stop()
+    await leaderboard.stop()
+    # Svuota il buffer delle visualizzazioni prima di chiudere il client
+    await view_buffer.stop()
+    shutdown_executors()
+    await close_client()
+    database.close()
 
 # Initialize FastAPI
-app = FastAPI(title="ML Academy API")
+app = FastAPI(title="ML Academy API", lifespan=lifespan)
 
 # Configure CORS
 app.add_middleware(
@@ -19,14 +80,18 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
+# Compressione br/gzip di JSON e HTML sopra COMPRESSION_MIN_SIZE byte
+app.add_middleware(CompressionMiddleware)
 
 # Create uploads directory if it doesn't exist
 os.makedirs("uploads/avatars", exist_ok=True)
 
 # Serve static files
 app.mount("/avatars", StaticFiles(directory="uploads/avatars"), name="avatars")
-app.mount("/static", StaticFiles(directory="static"), name="static")
+# Le varianti .br/.gz scritte da static_files.py vengono servite se accettate
+app.mount("/static", PrecompressedStaticFiles(directory="static"), name="static")
 
 # Include routers
 app.include_router(main_router)
@@ -34,15 +99,6 @@ app.include_router(admin_router)
 app.include_router(contact_router)
 app.include_router(content_view_router)
 
-# Startup and shutdown events
-@app.on_event("startup")
-async def startup_db_client():
-    app.mongodb_client = client
-
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    app.mongodb_client.close()
-
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
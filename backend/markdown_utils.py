@@ -1,14 +1,26 @@
 import re
 import os
+import json
+import time
+import hashlib
+import threading
 import markdown
 from fastapi import HTTPException
 import urllib.parse
 from markdown.extensions.codehilite import CodeHiliteExtension
 from markdown.extensions.toc import TocExtension
 from pygments.formatters import HtmlFormatter
+from asset_manifest import asset_manifest, fingerprinted_name
 
 CONTENT_DIR = "content/theory"
 
+# Da incrementare quando cambia l'HTML prodotto dal renderer: invalida
+# gli artefatti pre-renderizzati da static_build.py
+RENDERER_VERSION = "3"
+
+# Ogni quanti secondi (al massimo) controllare se l'albero dei contenuti è cambiato
+LINK_INDEX_CHECK_INTERVAL = float(os.getenv("LINK_INDEX_CHECK_INTERVAL", "5"))
+
 # Stile evidenziazione codice
 PYGMENTS_STYLE = 'rrt'
 PYGMENTS_CSS = HtmlFormatter(style=PYGMENTS_STYLE).get_style_defs('.codehilite')
@@ -62,51 +74,211 @@ details.code-container:not([open]) summary::after {
 }
 '''
 
-def protect_math_content(md_content):
-    math_blocks = []
-    pattern_block = re.compile(r'(\$\$.*?\$\$)', re.DOTALL)
-    pattern_inline = re.compile(r'(?<!\\)\$([^\$]*?(?<!\\))\$')
+# Gestore del pulsante Copy, delegato dal document: le pagine contengono
+# solo <button class="copy-button">, senza JavaScript inline
+COPY_BUTTON_JS = '''
+(function () {
+    if (window.__theoryCopyButtons) return;
+    window.__theoryCopyButtons = true;
+    document.addEventListener("click", function (event) {
+        var btn = event.target.closest && event.target.closest(".copy-button");
+        if (!btn) return;
+        var code = btn.parentElement.querySelector("pre");
+        if (!code) return;
+        navigator.clipboard.writeText(code.innerText);
+        btn.textContent = "Copied!";
+        setTimeout(function () { btn.textContent = "Copy"; }, 2000);
+    });
+})();
+'''
 
-    def replace_block(match):
-        math_blocks.append(match.group(1))
-        return f'@@MATH_BLOCK_{len(math_blocks)-1}@@'
+# Stili e script comuni a tutte le pagine di teoria, serviti una volta sola
+# da GET /theory/assets/{nome} con un nome versionato dal loro hash
+THEORY_ASSETS = {
+    "theory.css": (f"{PYGMENTS_CSS}\n{COPY_BUTTON_CSS}\n{COLLAPSIBLE_CSS}".encode("utf-8"), "text/css"),
+    "theory.js": (COPY_BUTTON_JS.encode("utf-8"), "application/javascript"),
+}
+THEORY_ASSETS_DIGEST = {
+    name: hashlib.sha256(body).hexdigest()[:12] for name, (body, _) in THEORY_ASSETS.items()
+}
 
-    def replace_inline(match):
-        math_blocks.append(match.group(0))
-        return f'@@MATH_INLINE_{len(math_blocks)-1}@@'
+# {"css": url, "js": url}, restituito insieme a ogni pagina di teoria
+THEORY_ASSET_URLS = {
+    name.rsplit(".", 1)[1]: f"/theory/assets/{fingerprinted_name(name, digest)}"
+    for name, digest in THEORY_ASSETS_DIGEST.items()
+}
+
+# Formule $$...$$ e $...$ (non precedute da backslash) in un'unica
+# alternativa: il testo si scorre una volta sola, e a parità di posizione
+# vince il blocco $$...$$
+MATH_RE = re.compile(r'(\$\$.*?\$\$)|(?<!\\)\$[^\$]*?(?<!\\)\$', re.DOTALL)
+MATH_PLACEHOLDER_RE = re.compile(r'@@MATH_(?:BLOCK|INLINE)_(\d+)@@')
+MATH_PARAGRAPH_BLOCK_RE = re.compile(r'<p>\s*(\$\$.*?\$\$)\s*</p>', re.DOTALL)
+MATH_PARAGRAPH_INLINE_RE = re.compile(r'<p>\s*(\$.*?\$)\s*</p>', re.DOTALL)
 
-    protected = pattern_block.sub(replace_block, md_content)
-    protected = pattern_inline.sub(replace_inline, protected)
-    return protected, math_blocks
+def protect_math_content(md_content):
+    """
+    Sostituisce le formule con segnaposto che il Markdown non tocca e
+    restituisce (testo protetto, formule); il segnaposto i-esimo
+    corrisponde a math_blocks[i]. Come nella versione a due regex, i
+    blocchi $$ hanno i primi indici e le formule inline i successivi: gli
+    indici finiscono negli id dei titoli generati da toc, che non devono
+    cambiare.
+    """
+    matches = list(MATH_RE.finditer(md_content))
+    math_blocks = [None] * len(matches)
+    next_block = 0
+    next_inline = sum(1 for m in matches if m.group(1) is not None)
+
+    parts = []
+    last = 0
+    for m in matches:
+        if m.group(1) is not None:
+            kind, i = 'BLOCK', next_block
+            next_block += 1
+        else:
+            kind, i = 'INLINE', next_inline
+            next_inline += 1
+        math_blocks[i] = m.group(0)
+        parts.append(md_content[last:m.start()])
+        parts.append(f'@@MATH_{kind}_{i}@@')
+        last = m.end()
+    parts.append(md_content[last:])
+    return ''.join(parts), math_blocks
 
 def restore_math_content(html_content, math_blocks):
-    for i, math in enumerate(math_blocks):
-        html_content = html_content.replace(f'@@MATH_BLOCK_{i}@@', math)
-        html_content = html_content.replace(f'@@MATH_INLINE_{i}@@', math)
-    return html_content
+    """
+    Rimette le formule al posto dei segnaposto in un solo passaggio
+    sull'HTML (prima erano due str.replace sull'intero documento per
+    formula). I segnaposto senza formula corrispondente restano com'erano.
+    """
+    def restore(match):
+        index = int(match.group(1))
+        return math_blocks[index] if index < len(math_blocks) else match.group(0)
+
+    return MATH_PLACEHOLDER_RE.sub(restore, html_content)
 
 def remove_math_paragraphs(html_content):
-    html_content = re.sub(r'<p>\s*(\$\$.*?\$\$)\s*</p>', r'\1', html_content, flags=re.DOTALL)
-    html_content = re.sub(r'<p>\s*(\$.*?\$)\s*</p>', r'\1', html_content, flags=re.DOTALL)
+    html_content = MATH_PARAGRAPH_BLOCK_RE.sub(r'\1', html_content)
+    html_content = MATH_PARAGRAPH_INLINE_RE.sub(r'\1', html_content)
     return html_content
 
+class LinkIndex:
+    """
+    Indice nome-file (minuscolo, con .md) -> percorso relativo a CONTENT_DIR,
+    usato per risolvere i link [[...]] senza un os.walk per ogni link.
+
+    L'indice viene ricostruito quando cambia la firma dell'albero (mtime
+    delle directory: aggiungere, rimuovere o rinominare un file cambia
+    l'mtime della directory che lo contiene). Il controllo della firma è
+    fatto al massimo ogni LINK_INDEX_CHECK_INTERVAL secondi.
+    """
+
+    def __init__(self, content_dir=CONTENT_DIR, check_interval=LINK_INDEX_CHECK_INTERVAL):
+        self.content_dir = content_dir
+        self.check_interval = check_interval
+        self.version = 0
+        self.digest = None
+        self._index = {}
+        self._signature = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _scan(self):
+        index = {}
+        signature = []
+        for root, _, files in os.walk(self.content_dir):
+            try:
+                signature.append((root, os.stat(root).st_mtime_ns))
+            except OSError:
+                continue
+            for file in files:
+                # Come il vecchio os.walk: vince il primo file trovato
+                index.setdefault(file.lower(), os.path.relpath(os.path.join(root, file), self.content_dir))
+        return index, tuple(signature)
+
+    @staticmethod
+    def _digest(index):
+        # Identifica l'insieme dei file (e dove si trovano), indipendentemente dagli mtime
+        h = hashlib.sha256()
+        for name, rel in sorted(index.items()):
+            h.update(f"{name}\0{rel}\n".encode("utf-8"))
+        return h.hexdigest()
+
+    def _signature_now(self):
+        signature = []
+        for root, _, _ in os.walk(self.content_dir):
+            try:
+                signature.append((root, os.stat(root).st_mtime_ns))
+            except OSError:
+                continue
+        return tuple(signature)
+
+    def refresh(self, force=False):
+        """
+        Ricostruisce l'indice se l'albero è cambiato (o se force=True).
+        Restituisce la versione corrente dell'indice.
+        """
+        now = time.monotonic()
+        if not force and self._signature is not None and now - self._checked_at < self.check_interval:
+            return self.version
+        with self._lock:
+            if not force and self._signature is not None and now - self._checked_at < self.check_interval:
+                return self.version
+            if force or self._signature is None or self._signature_now() != self._signature:
+                self._index, self._signature = self._scan()
+                digest = self._digest(self._index)
+                # Una riscrittura atomica cambia l'mtime della directory ma
+                # non l'insieme dei file: in quel caso la versione non cambia
+                if digest != self.digest:
+                    self.digest = digest
+                    self.version += 1
+            self._checked_at = time.monotonic()
+            return self.version
+
+    def invalidate(self):
+        """Forza la ricostruzione alla prossima richiesta."""
+        with self._lock:
+            self._signature = None
+
+    def lookup(self, name):
+        self.refresh()
+        return self._index.get(name)
+
+    def resolves_same(self, links):
+        """
+        True se ogni link in links ({nome file: percorso risolto}) punta
+        ancora allo stesso file: la pagina non va renderizzata di nuovo.
+        """
+        self.refresh()
+        index = self._index
+        return all(index.get(name) == target for name, target in links.items())
+
+
+link_index = LinkIndex()
+
+def link_target_name(name):
+    return name.lower().replace('&rsquo;', '\'') + '.md'
+
 def find_markdown_file(name):
-    target_filename = name.lower().replace('&rsquo;', '\'') + '.md'
-    for root, _, files in os.walk(CONTENT_DIR):
-        for file in files:
-            if file.lower() == target_filename:
-                return os.path.relpath(os.path.join(root, file), CONTENT_DIR)
-    return None
+    return link_index.lookup(link_target_name(name))
 
 def extract_title_from_markdown(md_content):
     match = re.search(r'^# (.+)', md_content, re.MULTILINE)
     return match.group(1) if match else "No title found"
 
-def process_obsidian_links(html_content):
+def process_obsidian_links(html_content, links=None):
+    """
+    Converte i link [[nota|testo]] in <a>. Se links è un dict, vi registra
+    per ogni link il percorso risolto (o None), così chi mette in cache la
+    pagina sa da quali file dipende.
+    """
     def replace_link(match):
         file_name = match.group(1).strip()
         display_text = match.group(2).strip() if match.group(2) else file_name
         file_path = find_markdown_file(file_name)
+        if links is not None:
+            links[link_target_name(file_name)] = file_path
         if file_path:
             link = f"/theory/{file_path.removesuffix('.md')}"
             return f'<a href="{link}" class="text-primary hover:underline">{display_text}</a>'
@@ -133,6 +305,38 @@ def build_directory_tree():
             categories[relative_path] = filtered_files
     return build_hierarchy(categories)
 
+_directory_tree = {"version": None, "tree": None, "body": None, "etag": None}
+_directory_tree_lock = threading.Lock()
+
+def tree_payload(tree):
+    """
+    Serializza l'albero una volta sola e ne calcola l'ETag (forte: hash
+    dei byte esatti restituiti al client).
+    """
+    body = json.dumps(tree, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return body, f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+def _current_directory_tree():
+    version = link_index.refresh()
+    with _directory_tree_lock:
+        if _directory_tree["version"] != version:
+            tree = build_directory_tree()
+            body, etag = tree_payload(tree)
+            _directory_tree.update(version=version, tree=tree, body=body, etag=etag)
+        return dict(_directory_tree)
+
+def get_directory_tree():
+    """
+    build_directory_tree() memorizzato: viene ricalcolato solo quando
+    link_index rileva che l'insieme dei file è cambiato.
+    """
+    return _current_directory_tree()["tree"]
+
+def get_directory_tree_json():
+    """Come get_directory_tree, ma restituisce (JSON in byte, ETag)."""
+    current = _current_directory_tree()
+    return current["body"], current["etag"]
+
 def build_hierarchy(categories):
     hierarchy = {'subcategories': {}, 'files': []}
     for path, files in categories.items():
@@ -145,15 +349,28 @@ def build_hierarchy(categories):
         current_node['files'] = files
     return hierarchy['subcategories']
 
-def process_image_links(html_content):
+def process_image_links(html_content, images=None):
+    """
+    Riscrive i src delle immagini con gli URL con fingerprint del manifest
+    (vedi asset_manifest.py): i TikZ restano in images/tikz, le altre
+    immagini puntano a images/posts. Se images è un dict, vi registra per
+    ogni immagine l'hash usato (o None), come process_obsidian_links fa per
+    i link, così la cache sa quando la pagina punta a un hash vecchio.
+    """
     pattern = r'(<img\b[^>]*\bsrc="([^"]+)"[^>]*>)'
     def replacer(match):
         full_tag = match.group(1)
         src_value = match.group(2)
         if re.search(r'\bclass\s*=\s*"[^"]*\btikz-svg\b[^"]*"', full_tag):
-            return full_tag
-        filename = src_value.rsplit('/', 1)[-1]
-        new_src = f'/static/images/posts/{filename}'
+            if not src_value.startswith('/static/'):
+                return full_tag
+            rel_path = src_value[len('/static/'):]
+        else:
+            filename = src_value.rsplit('/', 1)[-1]
+            rel_path = f'images/posts/{filename}'
+        if images is not None:
+            images[rel_path] = asset_manifest.digest(rel_path)
+        new_src = asset_manifest.url(rel_path)
         return full_tag.replace(f'src="{src_value}"', f'src="{new_src}"')
     return re.sub(pattern, replacer, html_content)
 
@@ -161,7 +378,27 @@ def parse_markdown_content(file_path: str):
     try:
         with open(file_path, "r", encoding="utf-8") as f:
             md_content = f.read()
-        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return render_markdown(md_content)
+
+def render_markdown(md_content: str):
+    """
+    Converte il testo Markdown di una nota in {"title", "content"}.
+    Separata da parse_markdown_content per poter renderizzare testo già letto
+    (es. dalla cache delle pagine) senza rileggere il file.
+    """
+    return render_markdown_with_links(md_content)[0]
+
+def render_markdown_with_links(md_content: str):
+    """
+    Come render_markdown, ma restituisce anche i link [[...]] risolti
+    ({nome file: percorso relativo o None}) e gli hash delle immagini usati
+    negli URL ({percorso sotto static: hash o None}).
+    """
+    links = {}
+    images = {}
+    try:
         title = extract_title_from_markdown(md_content)
         md_content = "\n".join(md_content.split("\n")[1:])
         
@@ -191,15 +428,8 @@ def parse_markdown_content(file_path: str):
             code_block = match.group(0)
 
             if str(code_block).count('</span>') > 3:
-                button = (
-                    '<button class="copy-button" '
-                    'onclick="(function(btn){'
-                    'var code=btn.parentElement.querySelector(\'pre\');'
-                    'if(code){navigator.clipboard.writeText(code.innerText);'
-                    'btn.textContent=\'Copied!\';'
-                    'setTimeout(function(){btn.textContent=\'Copy\';},2000);} '
-                    '})(this)">Copy</button>'
-                )
+                # Il click è gestito da theory.js (vedi COPY_BUTTON_JS)
+                button = '<button class="copy-button" type="button">Copy</button>'
                 return (
                     '<details class="code-container">\n'
                     '<summary>Code</summary>\n'
@@ -211,22 +441,46 @@ def parse_markdown_content(file_path: str):
 
         html_with_wrappers = re.sub(r'(<div class="codehilite"[\s\S]*?<\/div>)', wrap_code, html_body)
 
-        # Inietta gli stili e uno script minimale per gestire i collapsible (pseudo gestiti via CSS)
-        style_block = f"<style>{PYGMENTS_CSS}\n{COPY_BUTTON_CSS}\n{COLLAPSIBLE_CSS}</style>"
-
-        html_content = style_block + html_with_wrappers
+        # Stili e script del pulsante Copy non sono più nella pagina: il
+        # frontend carica theory.css e theory.js (vedi THEORY_ASSETS)
+        html_content = html_with_wrappers
         html_content = restore_math_content(html_content, math_blocks)
         html_content = html_content.replace('\\_', '_')
         html_content = remove_math_paragraphs(html_content)
-        html_content = process_obsidian_links(html_content)
-        html_content = process_image_links(html_content)
+        html_content = process_obsidian_links(html_content, links)
+        html_content = process_image_links(html_content, images)
         html_content = html_content.replace('\\$', '$')
         html_content = html_content.replace('\\space', ' ')
         
         return {
             "title": title,
             "content": html_content
-        }
+        }, links, images
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+def render_markdown_in_worker(md_content: str, links_digest: str = None):
+    """
+    render_markdown_with_links per i pool di rendering. In un processo
+    separato il link_index è una copia: se il digest del chiamante è
+    diverso lo si ricostruisce prima di risolvere i [[...]]. Anche
+    l'asset_manifest è una copia: lo si ricontrolla sempre (solo stat, gli
+    hash si ricalcolano per i file cambiati). HTTPException non sopravvive
+    al pickle tra processi, quindi diventa RuntimeError.
+    """
+    if links_digest is not None and link_index.digest != links_digest:
+        link_index.refresh(force=True)
+    asset_manifest.refresh(force=True)
+    try:
+        return render_markdown_with_links(md_content)
+    except HTTPException as e:
+        raise RuntimeError(e.detail)
+
+def warm_renderer():
+    """
+    Initializer dei processi di rendering: importa estensioni e lexer
+    Pygments una volta, così la prima pagina vera non paga il costo.
+    """
+    link_index.refresh()
+    render_markdown("# warmup\n\n```python\nx = 1\n```\n\n$x$ [[warmup]]\n")
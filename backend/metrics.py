@@ -0,0 +1,69 @@
+"""
+Metriche in memoria del processo, esposte da GET /admin/metrics.
+
+Niente dipendenze esterne: per ogni nome si tengono conteggio, somma e
+massimo di tutte le osservazioni più gli ultimi METRICS_WINDOW campioni,
+da cui si ricavano i percentili. I contatori sono semplici interi.
+
+    metrics.observe("password.run", seconds)
+    metrics.incr("password.rejected")
+"""
+import os
+from collections import deque
+
+METRICS_WINDOW = int(os.getenv("METRICS_WINDOW", "1024"))
+
+
+class Summary:
+    def __init__(self, window=METRICS_WINDOW):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.samples.append(value)
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def snapshot(self):
+        ordered = sorted(self.samples)
+
+        def pct(p):
+            return ordered[min(int(len(ordered) * p), len(ordered) - 1)] if ordered else 0.0
+
+        # Tempi in millisecondi
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count * 1000, 3) if self.count else 0.0,
+            "p50_ms": round(pct(0.50) * 1000, 3),
+            "p95_ms": round(pct(0.95) * 1000, 3),
+            "p99_ms": round(pct(0.99) * 1000, 3),
+            "max_ms": round(self.max * 1000, 3),
+        }
+
+
+class Metrics:
+    def __init__(self):
+        self._summaries = {}
+        self._counters = {}
+
+    def observe(self, name, seconds):
+        summary = self._summaries.get(name)
+        if summary is None:
+            summary = self._summaries[name] = Summary()
+        summary.observe(seconds)
+
+    def incr(self, name, n=1):
+        self._counters[name] = self._counters.get(name, 0) + n
+
+    def snapshot(self):
+        return {
+            "timings": {name: s.snapshot() for name, s in sorted(self._summaries.items())},
+            "counters": dict(sorted(self._counters.items())),
+        }
+
+
+metrics = Metrics()
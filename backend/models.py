@@ -1,7 +1,7 @@
 
 from datetime import datetime
 from typing import Dict, List, Optional, Any
-from pydantic import BaseModel, Field, GetCoreSchemaHandler
+from pydantic import BaseModel, Field, GetCoreSchemaHandler, create_model
 from bson import ObjectId
 from pydantic_core import core_schema
 
@@ -121,6 +121,14 @@ class Exercise(ExerciseBase):
         json_encoders = {ObjectId: str}
         arbitrary_types_allowed = True
 
+# Esercizio senza content, per GET /exercises/?fields=summary: stessi
+# campi (e stessa config) di Exercise, content escluso
+ExerciseSummary = create_model(
+    "ExerciseSummary",
+    __config__=Exercise.model_config,
+    **{name: (field.annotation, field) for name, field in Exercise.model_fields.items() if name != "content"},
+)
+
 class TheoryBase(BaseModel):
     title: str
     content: str
@@ -160,6 +168,10 @@ class LeaderboardEntry(BaseModel):
     problems_solved: int
     achievements: List[str]
 
+class LeaderboardRank(LeaderboardEntry):
+    rank: int
+    total_users: int
+
 # ----------------------
 # Avatar Upload
 # ----------------------
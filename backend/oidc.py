@@ -0,0 +1,170 @@
+"""
+Client OpenID Connect per il login con Google.
+
+Prima ogni callback apriva un nuovo AsyncOAuth2Client (nuova connessione
+TLS), riscaricava il documento di discovery e chiamava anche userinfo.
+Ora:
+
+- un solo client HTTP per processo, con connessioni riusate (chiuso allo
+  shutdown con close_client());
+- discovery e JWKS restano in cache per il max-age dei loro header
+  Cache-Control (OIDC_DEFAULT_CACHE_TTL se mancano);
+- l'id_token restituito con il codice viene verificato in locale (firma
+  con le chiavi JWKS, iss, aud, exp, at_hash) e le sue claim sostituiscono
+  la chiamata a userinfo, usata solo se l'id_token non ha l'email.
+
+Tutti gli endpoint arrivano dal documento di discovery, quindi puntando
+GOOGLE_DISCOVERY_URL a un provider OIDC locale si prova l'intero flusso.
+"""
+import os
+import re
+import time
+import asyncio
+import logging
+
+import httpx
+from jose import jwt, JWTError
+
+logger = logging.getLogger(__name__)
+
+GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
+GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
+GOOGLE_REDIRECT_URI = os.getenv("GOOGLE_REDIRECT_URI")
+GOOGLE_DISCOVERY_URL = os.getenv("GOOGLE_DISCOVERY_URL") #"https://accounts.google.com/.well-known/openid-configuration"
+OIDC_DEFAULT_CACHE_TTL = int(os.getenv("OIDC_DEFAULT_CACHE_TTL", "3600"))
+OIDC_HTTP_TIMEOUT = float(os.getenv("OIDC_HTTP_TIMEOUT", "10"))
+
+# Google firma gli id_token con iss con o senza schema
+GOOGLE_ISSUERS = ("https://accounts.google.com", "accounts.google.com")
+
+_client = None
+
+
+def get_client():
+    """
+    Client HTTP condiviso. È un httpx.AsyncClient semplice e senza stato
+    OAuth: i token dei singoli utenti non restano sul client.
+    """
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(timeout=OIDC_HTTP_TIMEOUT)
+    return _client
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def _max_age(headers):
+    cache_control = headers.get("cache-control", "").lower()
+    if "no-store" in cache_control or "no-cache" in cache_control:
+        return 0
+    match = re.search(r"max-age=(\d+)", cache_control)
+    if match:
+        age = int(headers.get("age", "0") or 0)
+        return max(int(match.group(1)) - age, 0)
+    return OIDC_DEFAULT_CACHE_TTL
+
+
+class CachedDocument:
+    """Documento JSON scaricato e tenuto finché il suo Cache-Control lo consente."""
+
+    def __init__(self, url_fn):
+        self._url_fn = url_fn
+        self._value = None
+        self._expires = 0.0
+        self._lock = asyncio.Lock()
+
+    async def get(self, force=False):
+        if not force and self._value is not None and time.monotonic() < self._expires:
+            return self._value
+        async with self._lock:
+            # Un'altra richiesta potrebbe averlo appena aggiornato
+            if not force and self._value is not None and time.monotonic() < self._expires:
+                return self._value
+            url = await self._url_fn()
+            resp = await get_client().get(url)
+            resp.raise_for_status()
+            self._value = resp.json()
+            self._expires = time.monotonic() + _max_age(resp.headers)
+            return self._value
+
+    def clear(self):
+        self._value = None
+        self._expires = 0.0
+
+
+async def _discovery_url():
+    return GOOGLE_DISCOVERY_URL
+
+
+discovery = CachedDocument(_discovery_url)
+
+
+async def _jwks_url():
+    return (await discovery.get())["jwks_uri"]
+
+
+jwks = CachedDocument(_jwks_url)
+
+
+async def verify_id_token(id_token, access_token=None):
+    """Verifica l'id_token in locale e ne restituisce le claim."""
+    conf = await discovery.get()
+    issuers = (conf["issuer"],) + (GOOGLE_ISSUERS if conf["issuer"] in GOOGLE_ISSUERS else ())
+    kid = jwt.get_unverified_header(id_token).get("kid")
+    keys = await jwks.get()
+    if kid and not any(key.get("kid") == kid for key in keys.get("keys", [])):
+        # Chiavi ruotate prima della scadenza della cache
+        keys = await jwks.get(force=True)
+    return jwt.decode(
+        id_token,
+        keys,
+        algorithms=conf.get("id_token_signing_alg_values_supported", ["RS256"]),
+        audience=GOOGLE_CLIENT_ID,
+        issuer=issuers,
+        access_token=access_token,
+    )
+
+
+async def authorization_url():
+    conf = await discovery.get()
+    return conf["authorization_endpoint"]
+
+
+async def get_user_info(code: str):
+    """
+    Scambia il codice e restituisce le informazioni dell'utente
+    (email, name, picture, ...) dalle claim dell'id_token.
+    """
+    client = get_client()
+    conf = await discovery.get()
+    resp = await client.post(conf["token_endpoint"], data={
+        "grant_type": "authorization_code",
+        "code": code,
+        "redirect_uri": GOOGLE_REDIRECT_URI,
+        "client_id": GOOGLE_CLIENT_ID,
+        "client_secret": GOOGLE_CLIENT_SECRET,
+    })
+    resp.raise_for_status()
+    token = resp.json()
+
+    if token.get("id_token"):
+        try:
+            claims = await verify_id_token(token["id_token"], token.get("access_token"))
+            if claims.get("email"):
+                return claims
+        except JWTError as e:
+            logger.warning(f"Invalid Google id_token: {e}")
+            raise
+
+    # Senza id_token (o senza email nelle claim) si ripiega su userinfo
+    resp = await client.get(
+        conf["userinfo_endpoint"],
+        headers={"Authorization": f"Bearer {token['access_token']}"},
+    )
+    resp.raise_for_status()
+    return resp.json()
@@ -0,0 +1,108 @@
+"""
+Paginazione keyset e export NDJSON per gli endpoint che restituiscono liste.
+
+Le liste erano troncate in silenzio (to_list(100), to_list(1000)) o caricate
+per intero in memoria. Ora:
+
+- ?limit=N&after=<cursore>: la pagina successiva parte dall'ultimo
+  documento visto (chiave di ordinamento + _id), quindi costa come la
+  prima anche in fondo alla collection, senza skip. Il body resta una
+  lista JSON; il cursore della pagina dopo è nell'header X-Next-Cursor
+  (assente all'ultima pagina).
+- ?format=ndjson: una riga JSON per documento, scritta mentre il cursore
+  Motor avanza, per gli export admin in memoria costante.
+- projection_for(Model): la projection Mongo ricavata dai campi del
+  modello di risposta, così dal database arrivano solo i campi restituiti
+  (niente hashed_password o content dove non servono).
+
+Il cursore è opaco per il client: JSON esteso BSON (datetime e ObjectId
+inclusi) in base64 url-safe.
+"""
+import os
+import json
+import base64
+
+from bson import json_util
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+
+PAGE_MAX_LIMIT = int(os.getenv("PAGE_MAX_LIMIT", "1000"))
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+NDJSON_BATCH_SIZE = 500
+
+
+def projection_for(model, *extra):
+    """
+    Projection con i campi di un modello pydantic (per alias, "id" -> "_id"),
+    più eventuali campi extra, es. la chiave di ordinamento per il cursore.
+    """
+    projection = {}
+    for name, field in model.model_fields.items():
+        key = field.alias or name
+        projection["_id" if key == "id" else key] = 1
+    for key in extra:
+        projection[key] = 1
+    return projection
+
+
+def encode_cursor(doc, sort_field="_id"):
+    payload = {"id": doc["_id"]}
+    if sort_field != "_id":
+        payload["v"] = doc.get(sort_field)
+    return base64.urlsafe_b64encode(json_util.dumps(payload).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor):
+    try:
+        position = json_util.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, TypeError):
+        position = None
+    if not isinstance(position, dict) or "id" not in position:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return position
+
+
+def keyset_filter(query, after=None, sort_field="_id", direction=1):
+    """Aggiunge a query la condizione "dopo il cursore" per l'ordinamento dato."""
+    if not after:
+        return query
+    position = decode_cursor(after)
+    op = "$gt" if direction == 1 else "$lt"
+    if sort_field == "_id":
+        condition = {"_id": {op: position["id"]}}
+    else:
+        condition = {"$or": [
+            {sort_field: {op: position.get("v")}},
+            {sort_field: position.get("v"), "_id": {op: position["id"]}},
+        ]}
+    return {"$and": [query, condition]} if query else condition
+
+
+async def fetch_page(collection, query, limit, after=None, sort_field="_id", direction=1, projection=None):
+    """
+    Restituisce (documenti, cursore della pagina dopo o None). Legge un
+    documento in più per sapere se esiste un'altra pagina.
+    """
+    sort = [(sort_field, direction)] + ([("_id", direction)] if sort_field != "_id" else [])
+    docs = await collection.find(
+        keyset_filter(query, after, sort_field, direction), projection
+    ).sort(sort).limit(limit + 1).to_list(limit + 1)
+    if len(docs) > limit:
+        docs = docs[:limit]
+        return docs, encode_cursor(docs[-1], sort_field)
+    return docs, None
+
+
+def set_next_cursor(response, cursor):
+    if cursor:
+        response.headers[NEXT_CURSOR_HEADER] = cursor
+
+
+def stream_ndjson(cursor, to_item=lambda doc: doc):
+    """StreamingResponse che scrive una riga JSON per documento del cursore Motor."""
+    async def rows():
+        async for doc in cursor.batch_size(NDJSON_BATCH_SIZE):
+            yield json.dumps(jsonable_encoder(to_item(doc)), ensure_ascii=False) + "\n"
+
+    return StreamingResponse(rows(), media_type="application/x-ndjson")
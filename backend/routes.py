@@ -1,22 +1,30 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Request, Query
 from fastapi.security import OAuth2PasswordRequestForm
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, Response
 from datetime import timedelta
 from bson import ObjectId
-from typing import List, Dict, Any, Optional
+from pymongo import ReturnDocument
+from typing import List, Dict, Any, Optional, Union
 from datetime import datetime
 import os
 import shutil
 from models import (
-    User, UserCreate, UserInDB, Token, Exercise, ExerciseCreate,
-    Theory, TheoryCreate, LeaderboardEntry, UserUpdate, AvatarResponse,
+    User, UserCreate, UserInDB, Token, Exercise, ExerciseCreate, ExerciseSummary,
+    Theory, TheoryCreate, LeaderboardEntry, LeaderboardRank, UserUpdate, AvatarResponse,
     ConsultationRequest, Product, Course, CourseContent, ContentView
 )
 from auth import (
     authenticate_user, create_access_token, get_current_active_user,
-    get_password_hash, get_google_user_info, ACCESS_TOKEN_EXPIRE_MINUTES
+    get_password_hash_async, get_google_user_info, ACCESS_TOKEN_EXPIRE_MINUTES
 )
 from database import db
+from executors import io_executor
+from analytics import view_buffer
+from user_cache import user_cache
+import oidc
+from leaderboard import leaderboard
+from exercise_catalog import exercise_catalog
+from pagination import PAGE_MAX_LIMIT, fetch_page, projection_for, set_next_cursor
 
 GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
 GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
@@ -47,9 +55,14 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
 
 @router.get("/auth/google/login")
 async def google_login():
-    # Invia l'utente a Google per login
+    # Invia l'utente a Google per login (endpoint dal documento di
+    # discovery in cache, così funziona anche con un provider OIDC locale)
+    try:
+        auth_endpoint = await oidc.authorization_url()
+    except Exception:
+        auth_endpoint = "https://accounts.google.com/o/oauth2/v2/auth"
     return RedirectResponse(
-        f"https://accounts.google.com/o/oauth2/v2/auth"
+        f"{auth_endpoint}"
         f"?response_type=code"
         f"&client_id={GOOGLE_CLIENT_ID}"
         f"&redirect_uri={GOOGLE_REDIRECT_URI}"
@@ -82,6 +95,7 @@ async def google_callback(code: str):
         )
         result = await db["users"].insert_one(new_user.dict(by_alias=True))
         user = await db["users"].find_one({"_id": result.inserted_id})
+        leaderboard.update(user["username"], user.get("points", 0), 0)
 
     # Crea token JWT
     access_token = create_access_token(data={"sub": user["username"]})
@@ -101,7 +115,7 @@ async def create_user(user: UserCreate):
             detail="Username or email already registered",
         )
     
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await get_password_hash_async(user.password)
     user_in_db = UserInDB(
         **user.dict(exclude={"password"}),
         hashed_password=hashed_password,
@@ -109,6 +123,7 @@ async def create_user(user: UserCreate):
     
     result = await db["users"].insert_one(user_in_db.dict(by_alias=True))
     created_user = await db["users"].find_one({"_id": result.inserted_id})
+    leaderboard.update(created_user["username"], created_user["points"], len(created_user["solved_exercises"]))
     
     return User(
         id=str(created_user["_id"]),
@@ -144,6 +159,7 @@ async def update_user_profile(
             {"_id": current_user.id},
             {"$set": user_data}
         )
+        user_cache.invalidate(current_user.username)
     
     updated_user = await db["users"].find_one({"_id": current_user.id})
     
@@ -157,21 +173,23 @@ async def update_user_profile(
         avatar_url=updated_user.get("avatar_url")
     )
 
+def _save_upload(source, file_path):
+    # Ensure the uploads directory exists
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with open(file_path, "wb") as buffer:
+        shutil.copyfileobj(source, buffer)
+
 @router.post("/users/me/avatar", response_model=AvatarResponse)
 async def upload_avatar(
     file: UploadFile = File(...),
     current_user: UserInDB = Depends(get_current_active_user)
 ):
-    # Ensure the uploads directory exists
-    os.makedirs("uploads/avatars", exist_ok=True)
-    
     # Create a unique filename
     file_extension = file.filename.split(".")[-1]
     file_path = f"uploads/avatars/{current_user.id}.{file_extension}"
     
-    # Save the file
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    # Save the file (off the event loop)
+    await io_executor.run(_save_upload, file.file, file_path)
     
     # Update the user's avatar_url in the database
     avatar_url = f"/avatars/{current_user.id}.{file_extension}"
@@ -179,6 +197,7 @@ async def upload_avatar(
         {"_id": current_user.id},
         {"$set": {"avatar_url": avatar_url}}
     )
+    user_cache.invalidate(current_user.username)
     
     return {"avatar_url": avatar_url}
 
@@ -187,13 +206,25 @@ async def upload_avatar(
 async def create_exercise(exercise: ExerciseCreate, current_user: UserInDB = Depends(get_current_active_user)):
     new_exercise = Exercise(**exercise.dict())
     result = await db["exercises"].insert_one(new_exercise.dict(by_alias=True))
+    exercise_catalog.invalidate()
     created_exercise = await db["exercises"].find_one({"_id": result.inserted_id})
     return Exercise(**created_exercise)
 
-@router.get("/exercises/", response_model=List[Exercise])
-async def get_exercises():
-    exercises = await db["exercises"].find().to_list(100)
-    return [Exercise(**exercise) for exercise in exercises]
+@router.get("/exercises/", response_model=List[Union[Exercise, ExerciseSummary]])
+async def get_exercises(
+    response: Response,
+    limit: int = Query(100, ge=1, le=PAGE_MAX_LIMIT),
+    after: Optional[str] = None,
+    fields: str = Query("full", enum=["full", "summary"]),
+):
+    # Paginazione per _id: il cursore della pagina dopo è in X-Next-Cursor.
+    # Con fields=summary niente content, che non viene nemmeno letto da Mongo
+    model = ExerciseSummary if fields == "summary" else Exercise
+    exercises, next_cursor = await fetch_page(
+        db["exercises"], {}, limit, after, projection=projection_for(model)
+    )
+    set_next_cursor(response, next_cursor)
+    return [model(**exercise) for exercise in exercises]
 
 @router.get("/exercises/{exercise_id}", response_model=Exercise)
 async def get_exercise(exercise_id: str):
@@ -204,8 +235,24 @@ async def get_exercise(exercise_id: str):
 
 # Theory routes
 
+def _etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+def _theory_structure_payload():
+    from markdown_utils import get_directory_tree_json
+    from static_build import artifacts
+    # Se c'è un build offline valido lo usiamo, altrimenti l'albero in memoria
+    payload = artifacts.load_structure()
+    if payload is None:
+        payload = get_directory_tree_json()
+    return payload
+
 @router.get("/theory/structure")
-async def get_theory_structure():
+async def get_theory_structure(request: Request):
     """
     Restituisce la struttura ad albero di tutto ciò che c'è
     in backend/content/theory/, sotto forma di:
@@ -214,21 +261,52 @@ async def get_theory_structure():
       "supervised": { … },
       …
     }
+    L'albero è calcolato una volta per versione dei contenuti e servito con
+    un ETag: se il client manda If-None-Match uguale si risponde 304.
     """
-    from markdown_utils import CONTENT_DIR, build_directory_tree
-    # build_directory_tree deve tornare esattamente questo formato
-    return build_directory_tree()
+    # stat del build, controllo dell'albero ed eventuale ricostruzione
+    # girano nel pool di I/O, anche quando la risposta sarà un 304
+    body, etag = await io_executor.run(_theory_structure_payload)
+
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+@router.get("/theory/assets/{filename}")
+async def get_theory_asset(filename: str, request: Request):
+    """
+    CSS (Pygments, pulsante Copy, blocchi collassabili) e JavaScript comuni
+    a tutte le pagine di teoria. Con il nome versionato (theory.<hash>.css,
+    come negli URL restituiti da /theory/{path}) la risposta è immutable;
+    il nome semplice va sempre rivalidato con l'ETag.
+    Registrata prima di /theory/{path:path}, che altrimenti la coprirebbe.
+    """
+    from markdown_utils import THEORY_ASSETS, THEORY_ASSETS_DIGEST
+    from asset_manifest import split_fingerprint, IMMUTABLE_CACHE_CONTROL
+    name, digest = split_fingerprint(filename)
+    if name not in THEORY_ASSETS:
+        raise HTTPException(404, f"Asset not found: {filename}")
+    body, media_type = THEORY_ASSETS[name]
+    etag = f'"{THEORY_ASSETS_DIGEST[name]}"'
+    immutable = digest == THEORY_ASSETS_DIGEST[name]
+    headers = {"ETag": etag, "Cache-Control": IMMUTABLE_CACHE_CONTROL if immutable else "no-cache"}
+    if _etag_matches(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type=media_type, headers=headers)
 
 @router.get("/theory/{path:path}")
 async def get_theory_content(path: str):
     """
     Legge il file Markdown corrispondente a path
     (es. 'intro/01-what-is-machine-learning') e ne restituisce
-    {"title": "...", "content": "<h1>…</h1>…"} via parse_markdown_content.
+    {"title": "...", "content": "<h1>…</h1>…", "assets": {"css": …, "js": …}}
+    via parse_markdown_content; assets sono gli URL di /theory/assets.
     
     Also records the view in the database for analytics.
     """
-    from markdown_utils import CONTENT_DIR, parse_markdown_content, build_directory_tree
+    from markdown_utils import CONTENT_DIR, THEORY_ASSET_URLS
+    from content_cache import get_rendered_page_async
     # Normalizza e costruisci il percorso al .md
     full_path = os.path.normpath(
         os.path.join(CONTENT_DIR,  f"{path}.md")
@@ -236,11 +314,13 @@ async def get_theory_content(path: str):
     # Blocca directory traversal
     if not full_path.startswith(os.path.join(CONTENT_DIR)):
         raise HTTPException(400, "Invalid path")
-    if not os.path.exists(full_path):
-        raise HTTPException(404, f"Content not found: {path}")
     
-    # parse_markdown_content legge, converte e ritorna dict {title, content}
-    content_data = parse_markdown_content(full_path)
+    # La cache rende la pagina solo se il file è cambiato dall'ultima volta;
+    # stat, lettura e rendering girano fuori dall'event loop
+    try:
+        content_data = await get_rendered_page_async(full_path)
+    except (FileNotFoundError, NotADirectoryError):
+        raise HTTPException(404, f"Content not found: {path}")
     
     # Create ContentView object
     view_data = ContentView(
@@ -256,40 +336,31 @@ async def get_theory_content(path: str):
     except Exception:
         pass  # Nessun utente loggato, si ignora
     
-    # Insert the view record into the database
-    await db["content_views"].insert_one(view_data.dict(by_alias=True))
+    # La visualizzazione viene scritta in batch dal buffer di analytics,
+    # senza far aspettare la risposta
+    view_buffer.record(view_data.dict(by_alias=True))
     
-    return content_data
+    # La pagina in cache resta condivisa: gli URL si aggiungono a una copia
+    return {**content_data, "assets": THEORY_ASSET_URLS}
 
 # Leaderboard routes
 
 @router.get("/leaderboard/", response_model=List[LeaderboardEntry])
-async def get_leaderboard():
-    users = await db["users"].find().sort("points", -1).limit(10).to_list(100)
-    
-    leaderboard = []
-    for user in users:
-        achievements = []
-        if user["points"] > 5000:
-            achievements.append("Expert")
-        elif user["points"] > 2000:
-            achievements.append("Intermediate")
-        else:
-            achievements.append("Beginner")
-            
-        if len(user["solved_exercises"]) > 20:
-            achievements.append("Problem Solver")
-            
-        leaderboard.append(
-            LeaderboardEntry(
-                username=user["username"],
-                score=user["points"],
-                problems_solved=len(user["solved_exercises"]),
-                achievements=achievements
-            )
-        )
-    
-    return leaderboard
+async def get_leaderboard(
+    offset: int = Query(0, ge=0),
+    limit: int = Query(10, ge=1, le=100),
+):
+    # Classifica in memoria, aggiornata da submit_solution (vedi leaderboard.py)
+    await leaderboard.ensure_loaded(db)
+    return [LeaderboardEntry(**entry) for entry in leaderboard.page(offset, limit)]
+
+@router.get("/leaderboard/rank/{username}", response_model=LeaderboardRank)
+async def get_leaderboard_rank(username: str):
+    await leaderboard.ensure_loaded(db)
+    rank = leaderboard.rank(username)
+    if rank is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return LeaderboardRank(**leaderboard.entry(username), rank=rank, total_users=len(leaderboard))
 
 # Exercises routes
 @router.post("/exercises/{exercise_id}/submit")
@@ -312,12 +383,23 @@ async def submit_solution(
         "Expert": 500
     }.get(exercise["difficulty"], 100)
     
-    await db["users"].update_one(
-        {"_id": current_user.id},
+    # Il filtro su solved_exercises evita di assegnare due volte i punti
+    # se arrivano due submit insieme; il documento aggiornato dà i nuovi
+    # punti alla classifica
+    updated_user = await db["users"].find_one_and_update(
+        {"_id": current_user.id, "solved_exercises": {"$ne": exercise_id}},
         {
             "$addToSet": {"solved_exercises": exercise_id},
             "$inc": {"points": points}
-        }
+        },
+        projection={"username": 1, "points": 1, "solved_exercises": 1},
+        return_document=ReturnDocument.AFTER,
+    )
+    user_cache.invalidate(current_user.username)
+    if updated_user is None:
+        return {"message": "Exercise already solved", "success": True}
+    leaderboard.update(
+        updated_user["username"], updated_user["points"], len(updated_user["solved_exercises"])
     )
     
     return {
@@ -328,7 +410,8 @@ async def submit_solution(
 
 @router.get("/users/me/progress")
 async def get_user_progress(current_user: UserInDB = Depends(get_current_active_user)):
-    total_exercises = await db["exercises"].count_documents({})
+    # Conteggio e difficoltà dalla mappa in memoria (vedi exercise_catalog.py)
+    total_exercises = await exercise_catalog.count(db)
     user_solved = len(current_user.solved_exercises)
     
     # Get statistics by difficulty
@@ -339,10 +422,10 @@ async def get_user_progress(current_user: UserInDB = Depends(get_current_active_
         "Expert": 0
     }
     
-    for exercise_id in current_user.solved_exercises:
-        exercise = await db["exercises"].find_one({"_id": ObjectId(exercise_id)})
-        if exercise and "difficulty" in exercise:
-            difficulty_stats[exercise["difficulty"]] += 1
+    difficulties = await exercise_catalog.difficulties(db, current_user.solved_exercises)
+    for difficulty in difficulties.values():
+        if difficulty in difficulty_stats:
+            difficulty_stats[difficulty] += 1
     
     return {
         "total_exercises": total_exercises,
@@ -0,0 +1,237 @@
+"""
+Build offline del corpus di teoria.
+
+    python static_build.py [--out build/theory] [--keep 2]
+
+Renderizza ogni nota sotto CONTENT_DIR con lo stesso renderer usato dalle
+route e scrive su disco, in una directory versionata:
+
+    build/theory/<version>/manifest.json
+    build/theory/<version>/structure.json
+    build/theory/<version>/pages/<percorso nota>.json   ({"title", "content"})
+
+Il file build/theory/current contiene la versione attiva e viene
+sostituito atomicamente alla fine del build. A runtime ArtifactStore
+serve questi file solo se corrispondono ancora ai sorgenti (sha256 della
+nota, RENDERER_VERSION e destinazione dei suoi link [[...]]); altrimenti
+le route ricadono sul rendering live. La versione dipende anche dagli
+hash delle immagini (asset_manifest), che finiscono negli URL delle
+pagine.
+"""
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import argparse
+import threading
+
+from markdown_utils import (
+    CONTENT_DIR, RENDERER_VERSION, link_index, render_markdown_with_links, build_directory_tree,
+    tree_payload,
+)
+from asset_manifest import asset_manifest
+
+logger = logging.getLogger(__name__)
+
+THEORY_BUILD_DIR = os.getenv("THEORY_BUILD_DIR", "build/theory")
+CURRENT_POINTER = "current"
+
+
+def _write_json(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def _note_key(full_path):
+    return os.path.relpath(full_path, CONTENT_DIR).replace("\\", "/").removesuffix(".md")
+
+
+def build(out_dir=THEORY_BUILD_DIR, keep=2):
+    """
+    Esegue il build completo e restituisce il manifest scritto.
+    """
+    started = time.time()
+    link_index.refresh(force=True)
+
+    notes = sorted(
+        os.path.join(root, f)
+        for root, _, files in os.walk(CONTENT_DIR)
+        for f in files if f.endswith(".md")
+    )
+
+    sources = {}
+    for full_path in notes:
+        with open(full_path, "rb") as f:
+            raw = f.read()
+        sources[_note_key(full_path)] = raw
+
+    h = hashlib.sha256(
+        f"{RENDERER_VERSION}\0{link_index.digest}\0{asset_manifest.combined_digest()}\n".encode("utf-8")
+    )
+    pages = {}
+    for key, raw in sources.items():
+        digest = hashlib.sha256(raw).hexdigest()
+        pages[key] = {"sha256": digest}
+        h.update(f"{key}\0{digest}\n".encode("utf-8"))
+    version = h.hexdigest()[:16]
+
+    version_dir = os.path.join(out_dir, version)
+    staging_dir = f"{version_dir}.tmp"
+    shutil.rmtree(staging_dir, ignore_errors=True)
+
+    failed = []
+    for key, raw in sources.items():
+        try:
+            page, links, images = render_markdown_with_links(raw.decode("utf-8"))
+        except Exception as e:
+            # La nota non ha artefatto: la route la renderizzerà live
+            logger.warning(f"Render failed for {key}: {e}")
+            failed.append(key)
+            del pages[key]
+            continue
+        pages[key]["links"] = links
+        pages[key]["images"] = images
+        _write_json(os.path.join(staging_dir, "pages", f"{key}.json"), page)
+
+    _write_json(os.path.join(staging_dir, "structure.json"), build_directory_tree())
+
+    manifest = {
+        "version": version,
+        "renderer_version": RENDERER_VERSION,
+        "links_digest": link_index.digest,
+        "built_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "pages": pages,
+        "failed": failed,
+    }
+    _write_json(os.path.join(staging_dir, "manifest.json"), manifest)
+
+    shutil.rmtree(version_dir, ignore_errors=True)
+    os.replace(staging_dir, version_dir)
+
+    pointer = os.path.join(out_dir, CURRENT_POINTER)
+    with open(f"{pointer}.tmp", "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(f"{pointer}.tmp", pointer)
+
+    _prune(out_dir, keep, version)
+    logger.info(
+        f"Built {len(pages)} pages into {version_dir} in {time.time() - started:.2f}s"
+        + (f" ({len(failed)} failed)" if failed else "")
+    )
+    return manifest
+
+
+def _prune(out_dir, keep, current):
+    versions = [
+        d for d in os.listdir(out_dir)
+        if os.path.isdir(os.path.join(out_dir, d)) and not d.endswith(".tmp")
+    ]
+    versions.sort(key=lambda d: os.stat(os.path.join(out_dir, d)).st_mtime, reverse=True)
+    for old in [v for v in versions if v != current][max(keep - 1, 0):]:
+        shutil.rmtree(os.path.join(out_dir, old), ignore_errors=True)
+
+
+class ArtifactStore:
+    """
+    Lettura degli artefatti prodotti da build(). Il manifest attivo viene
+    ricaricato solo quando cambia il file puntatore "current".
+    """
+
+    def __init__(self, build_dir=THEORY_BUILD_DIR):
+        self.build_dir = build_dir
+        self._pointer_mtime = None
+        self._manifest = None
+        self._structure = None
+        self._lock = threading.Lock()
+
+    def _current(self, check_tree=False):
+        pointer = os.path.join(self.build_dir, CURRENT_POINTER)
+        try:
+            mtime = os.stat(pointer).st_mtime_ns
+        except OSError:
+            self._manifest = None
+            return None
+        with self._lock:
+            if mtime != self._pointer_mtime:
+                try:
+                    with open(pointer, encoding="utf-8") as f:
+                        version = f.read().strip()
+                    with open(os.path.join(self.build_dir, version, "manifest.json"), encoding="utf-8") as f:
+                        self._manifest = json.load(f)
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Unreadable theory build in {self.build_dir}: {e}")
+                    self._manifest = None
+                self._structure = None
+                self._pointer_mtime = mtime
+            manifest = self._manifest
+        if manifest is None:
+            return None
+        # Artefatti prodotti da un altro renderer non sono più affidabili; la
+        # struttura vale solo se l'insieme delle note non è cambiato
+        if manifest.get("renderer_version") != RENDERER_VERSION:
+            return None
+        if check_tree:
+            link_index.refresh()
+            if manifest.get("links_digest") != link_index.digest:
+                return None
+        return manifest
+
+    def load_page(self, full_path, digest):
+        """
+        Restituisce ({"title", "content"}, links, images) pre-renderizzato
+        per la nota, oppure None se manca l'artefatto, se la nota è cambiata
+        dopo il build, se uno dei suoi link ora punta a un altro file o se
+        una delle sue immagini ha cambiato hash.
+        """
+        manifest = self._current()
+        if manifest is None:
+            return None
+        key = _note_key(full_path)
+        info = manifest["pages"].get(key)
+        if not info or info["sha256"] != digest:
+            return None
+        links = info.get("links", {})
+        if not link_index.resolves_same(links):
+            return None
+        # Build senza "images" (precedenti al fingerprint): non verificabili
+        images = info.get("images")
+        if images is None or not asset_manifest.matches(images):
+            return None
+        try:
+            with open(os.path.join(self.build_dir, manifest["version"], "pages", f"{key}.json"), encoding="utf-8") as f:
+                return json.load(f), links, images
+        except (OSError, ValueError):
+            return None
+
+    def load_structure(self):
+        """
+        Restituisce (JSON in byte, ETag) dell'albero pre-calcolato, oppure
+        None se il build manca o non corrisponde più alle note presenti.
+        """
+        manifest = self._current(check_tree=True)
+        if manifest is None:
+            return None
+        if self._structure is None:
+            try:
+                with open(os.path.join(self.build_dir, manifest["version"], "structure.json"), encoding="utf-8") as f:
+                    self._structure = tree_payload(json.load(f))
+            except (OSError, ValueError):
+                return None
+        return self._structure
+
+
+artifacts = ArtifactStore()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-render the theory corpus to JSON artifacts")
+    parser.add_argument("--out", default=THEORY_BUILD_DIR, help="output directory")
+    parser.add_argument("--keep", type=int, default=2, help="number of builds to keep")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    build(args.out, args.keep)
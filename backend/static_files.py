@@ -0,0 +1,141 @@
+"""
+File statici con varianti precompresse.
+
+    python static_files.py [directory ...] [--force]
+
+Il comando scrive accanto a ogni file testuale (SVG, CSS, JS, ...) sotto
+static/ le varianti `.gz` (gzip -9) e, se il pacchetto `brotli` è
+installato, `.br` (quality 11). I file già aggiornati vengono saltati, e
+così quelli in cui la compressione non fa risparmiare almeno
+PRECOMPRESS_MIN_SAVING.
+
+PrecompressedStaticFiles sostituisce StaticFiles: se il client accetta br
+o gzip ed esiste una variante non più vecchia del file originale, serve
+quella con Content-Encoding e il Content-Type dell'originale, senza
+comprimere nulla a runtime. Gli URL con fingerprint di asset_manifest.py
+vengono ricondotti al file originale e serviti con Cache-Control immutable.
+"""
+import os
+import sys
+import gzip
+import stat
+import argparse
+from mimetypes import guess_type
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+from starlette.staticfiles import StaticFiles, NotModifiedResponse
+
+from compression import brotli, choose_encoding
+from asset_manifest import asset_manifest, IMMUTABLE_CACHE_CONTROL
+
+STATIC_DIR = "static"
+PRECOMPRESS_EXTENSIONS = (".svg", ".css", ".js", ".json", ".html", ".txt", ".xml")
+PRECOMPRESS_MIN_SIZE = int(os.getenv("PRECOMPRESS_MIN_SIZE", "1024"))
+PRECOMPRESS_MIN_SAVING = float(os.getenv("PRECOMPRESS_MIN_SAVING", "0.1"))
+
+SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    async def get_response(self, path, scope):
+        # URL con fingerprint (asset_manifest.py): si serve il file originale
+        path, immutable = await anyio.to_thread.run_sync(asset_manifest.resolve, path)
+        response = await self._get_response(path, scope)
+        if immutable and response.status_code in (200, 304):
+            response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+        return response
+
+    async def _get_response(self, path, scope):
+        if scope["method"] in ("GET", "HEAD"):
+            request_headers = Headers(scope=scope)
+            encoding = choose_encoding(request_headers.get("accept-encoding", ""), ("br", "gzip"))
+            while encoding is not None:
+                response = await anyio.to_thread.run_sync(self._variant, path, encoding)
+                if response is not None:
+                    if self.is_not_modified(response.headers, request_headers):
+                        return NotModifiedResponse(response.headers)
+                    return response
+                # Nessun .br: si prova il .gz
+                encoding = "gzip" if encoding == "br" else None
+        response = await super().get_response(path, scope)
+        if response.status_code == 200 and os.path.splitext(path)[1] in PRECOMPRESS_EXTENSIONS:
+            response.headers.add_vary_header("Accept-Encoding")
+        return response
+
+    def _variant(self, path, encoding):
+        full_path, variant_stat = self.lookup_path(path + SUFFIXES[encoding])
+        if variant_stat is None or not stat.S_ISREG(variant_stat.st_mode):
+            return None
+        _, original_stat = self.lookup_path(path)
+        if original_stat is None or original_stat.st_mtime > variant_stat.st_mtime:
+            return None  # variante vecchia: si serve l'originale
+        media_type = guess_type(path)[0] or "text/plain"
+        return FileResponse(
+            full_path,
+            stat_result=variant_stat,
+            media_type=media_type,
+            headers={"Content-Encoding": encoding, "Vary": "Accept-Encoding"},
+        )
+
+
+def _compress(data, encoding):
+    if encoding == "br":
+        return brotli.compress(data, quality=11)
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def precompress(directories=(STATIC_DIR,), force=False):
+    """Scrive le varianti .gz/.br mancanti o vecchie; restituisce un riepilogo."""
+    encodings = ["gzip"] + (["br"] if brotli is not None else [])
+    summary = {"files": 0, "written": 0, "skipped": 0, "bytes_in": 0, "bytes_out": 0}
+    for directory in directories:
+        for root, _, files in os.walk(directory):
+            for name in files:
+                if not name.endswith(PRECOMPRESS_EXTENSIONS):
+                    continue
+                path = os.path.join(root, name)
+                size = os.path.getsize(path)
+                if size < PRECOMPRESS_MIN_SIZE:
+                    continue
+                summary["files"] += 1
+                mtime = os.path.getmtime(path)
+                data = None
+                for encoding in encodings:
+                    target = path + SUFFIXES[encoding]
+                    if not force and os.path.exists(target) and os.path.getmtime(target) >= mtime:
+                        summary["skipped"] += 1
+                        continue
+                    if data is None:
+                        with open(path, "rb") as f:
+                            data = f.read()
+                    compressed = _compress(data, encoding)
+                    if len(compressed) > len(data) * (1 - PRECOMPRESS_MIN_SAVING):
+                        # Non conviene: una variante vecchia non deve restare
+                        if os.path.exists(target):
+                            os.remove(target)
+                        continue
+                    tmp = f"{target}.tmp"
+                    with open(tmp, "wb") as f:
+                        f.write(compressed)
+                    os.replace(tmp, target)
+                    summary["written"] += 1
+                    summary["bytes_in"] += len(data)
+                    summary["bytes_out"] += len(compressed)
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write .gz/.br variants of static text assets")
+    parser.add_argument("directories", nargs="*", default=[STATIC_DIR], help="directories to scan")
+    parser.add_argument("--force", action="store_true", help="rewrite variants even if up to date")
+    args = parser.parse_args()
+
+    summary = precompress(args.directories, force=args.force)
+    print(
+        f"{summary['files']} files, {summary['written']} variants written "
+        f"({summary['bytes_in']} -> {summary['bytes_out']} bytes), {summary['skipped']} up to date"
+    )
+    if brotli is None:
+        print("brotli not installed: only .gz variants written", file=sys.stderr)
@@ -0,0 +1,153 @@
+"""
+Contatori pre-aggregati per la dashboard di amministrazione.
+
+    python stats_rollup.py --backfill
+
+Invece di contare ogni volta content_views e users, la dashboard legge
+pochi documenti della collection stats_rollups, uno per metrica,
+granularità (hour, day, month) e intervallo:
+
+    {"_id": "views:day:2024-05-01T00:00:00", "metric": "views",
+     "granularity": "day", "bucket": datetime(2024, 5, 1), "count": 42}
+
+I contatori vengono aggiornati con $inc in upsert:
+- "views": quando il buffer di analytics scrive un batch di content_views;
+- "logins": numero di utenti il cui last_login cade nell'intervallo (quello
+  che contava la dashboard): a ogni login si incrementa l'intervallo nuovo
+  e si decrementa quello del last_login precedente.
+
+I contatori valgono solo da quando esistono; --backfill li ricalcola dai
+dati grezzi e scrive il documento "meta" che abilita la lettura dalla
+dashboard. Fino ad allora la dashboard continua a contare le collection.
+"""
+import asyncio
+import logging
+from collections import Counter
+from datetime import datetime
+
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_COLLECTION = "stats_rollups"
+META_ID = "meta"
+GRANULARITIES = ("hour", "day", "month")
+
+
+def truncate(ts: datetime, granularity: str) -> datetime:
+    ts = ts.replace(minute=0, second=0, microsecond=0)
+    if granularity in ("day", "month"):
+        ts = ts.replace(hour=0)
+    if granularity == "month":
+        ts = ts.replace(day=1)
+    return ts
+
+
+def _rollup_id(metric, granularity, bucket):
+    return f"{metric}:{granularity}:{bucket.isoformat()}"
+
+
+def _inc_ops(metric, counts):
+    """counts: {inizio ora: n} -> UpdateOne per ogni granularità."""
+    totals = Counter()
+    for hour, n in counts.items():
+        for granularity in GRANULARITIES:
+            totals[(granularity, truncate(hour, granularity))] += n
+    return [
+        UpdateOne(
+            {"_id": _rollup_id(metric, granularity, bucket)},
+            {
+                "$inc": {"count": n},
+                "$setOnInsert": {"metric": metric, "granularity": granularity, "bucket": bucket},
+            },
+            upsert=True,
+        )
+        for (granularity, bucket), n in totals.items() if n
+    ]
+
+
+async def record_views(db, views):
+    """Aggiorna i contatori per un batch di documenti content_views."""
+    counts = Counter(truncate(v["viewed_at"], "hour") for v in views if v.get("viewed_at"))
+    ops = _inc_ops("views", counts)
+    if ops:
+        await db[ROLLUP_COLLECTION].bulk_write(ops, ordered=False)
+
+
+async def record_login(db, previous: datetime, current: datetime):
+    """Sposta l'utente dall'intervallo del login precedente a quello attuale."""
+    counts = Counter({truncate(current, "hour"): 1})
+    if previous is not None:
+        counts[truncate(previous, "hour")] -= 1
+    ops = _inc_ops("logins", counts)
+    if ops:
+        await db[ROLLUP_COLLECTION].bulk_write(ops, ordered=False)
+
+
+async def rollups_ready(db) -> bool:
+    return await db[ROLLUP_COLLECTION].find_one({"_id": META_ID}, {"_id": 1}) is not None
+
+
+async def load_buckets(db, metric, granularity, start, end=None):
+    """Restituisce {inizio intervallo: conteggio} per gli intervalli in [start, end)."""
+    query = {"metric": metric, "granularity": granularity, "bucket": {"$gte": truncate(start, granularity)}}
+    if end is not None:
+        query["bucket"]["$lt"] = end
+    docs = await db[ROLLUP_COLLECTION].find(query, {"bucket": 1, "count": 1}).to_list(None)
+    return {doc["bucket"]: doc["count"] for doc in docs}
+
+
+async def window_total(db, metric, granularity, start=None):
+    """Somma dei contatori da start (troncato alla granularità) a oggi."""
+    match = {"metric": metric, "granularity": granularity}
+    if start is not None:
+        match["bucket"] = {"$gte": truncate(start, granularity)}
+    result = await db[ROLLUP_COLLECTION].aggregate([
+        {"$match": match},
+        {"$group": {"_id": None, "total": {"$sum": "$count"}}},
+    ]).to_list(1)
+    return result[0]["total"] if result else 0
+
+
+async def _hourly_counts(db, collection, field):
+    pipeline = [
+        {"$match": {field: {"$type": "date"}}},
+        {"$group": {
+            "_id": {"$dateToString": {"format": "%Y-%m-%dT%H", "date": f"${field}"}},
+            "count": {"$sum": 1},
+        }},
+    ]
+    rows = await db[collection].aggregate(pipeline, allowDiskUse=True).to_list(None)
+    return {datetime.strptime(row["_id"], "%Y-%m-%dT%H"): row["count"] for row in rows}
+
+
+async def backfill(db):
+    """
+    Ricalcola tutti i contatori da content_views e users. Da lanciare a
+    traffico basso: gli incrementi arrivati durante il ricalcolo si perdono.
+    """
+    sources = {"views": ("content_views", "viewed_at"), "logins": ("users", "last_login")}
+    for metric, (collection, field) in sources.items():
+        counts = await _hourly_counts(db, collection, field)
+        await db[ROLLUP_COLLECTION].delete_many({"metric": metric})
+        ops = _inc_ops(metric, counts)
+        if ops:
+            await db[ROLLUP_COLLECTION].bulk_write(ops, ordered=False)
+        logger.info(f"Backfilled {metric}: {sum(counts.values())} events in {len(ops)} buckets")
+    await db[ROLLUP_COLLECTION].update_one(
+        {"_id": META_ID}, {"$set": {"backfilled_at": datetime.utcnow()}}, upsert=True
+    )
+
+
+if __name__ == "__main__":
+    import argparse
+    from database import db
+
+    parser = argparse.ArgumentParser(description="Maintain the admin dashboard rollup counters")
+    parser.add_argument("--backfill", action="store_true", help="rebuild all counters from the raw collections")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    if args.backfill:
+        asyncio.run(backfill(db))
+    else:
+        parser.print_help()
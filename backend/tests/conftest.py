@@ -0,0 +1,5 @@
+import os
+import sys
+
+# I moduli del backend si importano in modo piatto (from database import db)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,76 @@
+import asyncio
+
+from pymongo import IndexModel, ASCENDING
+from pymongo.errors import OperationFailure
+
+import indexes
+
+TTL = IndexModel([("viewed_at", ASCENDING)], name="viewed_at", expireAfterSeconds=30 * 86400)
+PLAIN = IndexModel([("viewed_at", ASCENDING)], name="viewed_at")
+
+
+class FakeCollection:
+    def __init__(self, existing):
+        self.existing = existing  # nome -> opzioni, come index_information()
+        self.created = []
+        self.dropped = []
+
+    async def create_indexes(self, models):
+        for model in models:
+            spec = model.document
+            current = self.existing.get(spec["name"])
+            if current is not None and current.get("expireAfterSeconds") != spec.get("expireAfterSeconds"):
+                raise OperationFailure("Index already exists with different options", code=85)
+            self.existing[spec["name"]] = {k: v for k, v in spec.items() if k != "name"}
+            self.created.append(spec["name"])
+
+    async def index_information(self):
+        return self.existing
+
+    async def drop_index(self, name):
+        del self.existing[name]
+        self.dropped.append(name)
+
+
+class FakeDb:
+    def __init__(self, existing):
+        self.collection = FakeCollection(existing)
+        self.commands = []
+
+    def __getitem__(self, name):
+        return self.collection
+
+    async def command(self, *args, **kwargs):
+        self.commands.append((args, kwargs))
+        index = kwargs["index"]
+        self.collection.existing["viewed_at"]["expireAfterSeconds"] = index["expireAfterSeconds"]
+
+
+def test_ttl_removed_when_days_set_back_to_zero():
+    db = FakeDb({"viewed_at": {"key": [("viewed_at", 1)], "expireAfterSeconds": 86400}})
+    assert asyncio.run(indexes._ensure_index(db, "content_views", PLAIN))
+    assert db.collection.dropped == ["viewed_at"]
+    assert db.collection.created == ["viewed_at"]
+    assert "expireAfterSeconds" not in db.collection.existing["viewed_at"]
+    assert db.commands == []
+
+
+def test_ttl_added_with_collmod():
+    db = FakeDb({"viewed_at": {"key": [("viewed_at", 1)]}})
+    assert asyncio.run(indexes._ensure_index(db, "content_views", TTL))
+    assert db.commands == [(("collMod", "content_views"), {"index": {
+        "keyPattern": {"viewed_at": 1}, "expireAfterSeconds": 30 * 86400,
+    }})]
+    assert db.collection.dropped == []
+    assert db.collection.existing["viewed_at"]["expireAfterSeconds"] == 30 * 86400
+
+
+def test_other_conflicts_are_reported():
+    db = FakeDb({"viewed_at": {"key": [("viewed_at", 1)], "unique": True}})
+    db.collection.create_indexes = _raise_conflict
+    assert not asyncio.run(indexes._ensure_index(db, "content_views", PLAIN))
+    assert db.collection.dropped == []
+
+
+async def _raise_conflict(models):
+    raise OperationFailure("Index already exists with different options", code=86)
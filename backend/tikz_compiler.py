@@ -0,0 +1,254 @@
+"""
+Conversione dei blocchi ```tikz dei file Markdown in SVG.
+
+    python tikz_compiler.py [root] [--jobs N] [--force]
+
+Sostituisce update_tikz.sh mantenendo lo stesso formato:
+
+1. ogni blocco ```tikz ... ``` viene identificato dall'md5 del suo contenuto
+   (stesso hash calcolato dallo script bash, quindi gli SVG già presenti in
+   static/images/tikz restano validi);
+2. gli SVG mancanti vengono compilati con pdflatex + pdf2svg in parallelo,
+   un processo per blocco, su un pool grande quanto i core disponibili;
+3. il blocco viene sostituito nel Markdown da un tag <img class="tikz-svg">
+   e il file viene riscritto una sola volta, in modo atomico.
+
+Un manifest (sha256 di ogni file dopo l'elaborazione) permette di saltare
+i file non toccati dall'ultimo giro. Se la compilazione di un blocco
+fallisce il blocco resta nel Markdown, così il giro successivo lo riprova.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import tempfile
+import subprocess
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from markdown_utils import CONTENT_DIR
+
+TIKZ_DIR = "static/images/tikz"
+TIKZ_MANIFEST = os.getenv("TIKZ_MANIFEST", "build/tikz_manifest.json")
+TIKZ_TIMEOUT = int(os.getenv("TIKZ_TIMEOUT", "120"))
+
+IMG_TAG = (
+    '<img src="/static/images/tikz/{hash}.svg" '
+    'style="display: block; width: 100%; height: auto; max-height: 600px;" '
+    'class="tikz-svg" />'
+)
+
+
+def extract_blocks(text):
+    """
+    Divide il testo in righe e individua i blocchi tikz.
+    Restituisce (righe, blocchi) dove ogni blocco è (inizio, fine, hash, sorgente)
+    con inizio/fine indici delle righe di apertura e chiusura.
+    """
+    lines = text.split("\n")
+    if lines and lines[-1] == "":
+        lines.pop()
+    blocks = []
+    start = None
+    content = []
+    for i, line in enumerate(lines):
+        if line.startswith("```tikz"):
+            start = i
+            content = []
+            continue
+        if start is not None and line.startswith("```"):
+            source = "".join(l + "\n" for l in content)
+            digest = hashlib.md5(source.encode("utf-8")).hexdigest()
+            blocks.append((start, i, digest, source))
+            start = None
+            continue
+        if start is not None:
+            content.append(line)
+    return lines, blocks
+
+
+def replace_blocks(lines, blocks, compiled):
+    """Sostituisce con un <img> i blocchi il cui SVG esiste."""
+    out = []
+    pos = 0
+    for start, end, digest, _ in blocks:
+        if digest not in compiled:
+            continue
+        out.extend(lines[pos:start])
+        out.append(IMG_TAG.format(hash=digest))
+        pos = end + 1
+    out.extend(lines[pos:])
+    return "".join(l + "\n" for l in out)
+
+
+def compile_block(digest, source, out_dir):
+    """
+    Compila un blocco in out_dir/<digest>.svg. Gira in un processo del pool.
+    Restituisce (digest, secondi, errore o None).
+    """
+    started = time.perf_counter()
+    svg_path = os.path.join(out_dir, f"{digest}.svg")
+    with tempfile.TemporaryDirectory(prefix="tikz_") as tmp:
+        tex = os.path.join(tmp, f"temp_{digest}.tex")
+        pdf = os.path.join(tmp, f"temp_{digest}.pdf")
+        with open(tex, "w", encoding="utf-8") as f:
+            f.write("\\documentclass[preview]{standalone}\n")
+            f.write(source)
+        try:
+            subprocess.run(
+                ["pdflatex", "-interaction=nonstopmode", f"temp_{digest}.tex"],
+                cwd=tmp, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                timeout=TIKZ_TIMEOUT,
+            )
+            if not os.path.exists(pdf):
+                return digest, time.perf_counter() - started, "pdflatex produced no PDF"
+            tmp_svg = os.path.join(tmp, f"{digest}.svg")
+            result = subprocess.run(
+                ["pdf2svg", pdf, tmp_svg],
+                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=TIKZ_TIMEOUT,
+            )
+            if result.returncode != 0 or not os.path.exists(tmp_svg):
+                return digest, time.perf_counter() - started, f"pdf2svg failed: {result.stderr.decode(errors='replace').strip()}"
+            shutil.move(tmp_svg, svg_path)
+        except subprocess.TimeoutExpired as e:
+            return digest, time.perf_counter() - started, f"timeout in {e.cmd[0]}"
+    return digest, time.perf_counter() - started, None
+
+
+def _load_manifest(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_manifest(path, manifest):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(f"{path}.tmp", path)
+
+
+def _write_atomic(path, text):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    shutil.copymode(path, tmp)
+    os.replace(tmp, path)
+
+
+def run(root=CONTENT_DIR, jobs=None, force=False, out_dir=TIKZ_DIR, manifest_path=TIKZ_MANIFEST, paths=None):
+    """
+    Elabora tutti i .md sotto root (o solo quelli in paths).
+    Restituisce un dizionario con il riepilogo del giro (tempi dei singoli
+    blocchi e file riscritti compresi); non stampa nulla.
+    """
+    started = time.perf_counter()
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = {} if force else _load_manifest(manifest_path)
+
+    if paths is None:
+        paths = [
+            os.path.join(r, f)
+            for r, _, files in os.walk(root)
+            for f in files if f.endswith(".md")
+        ]
+
+    pending = {}   # file -> (testo, righe, blocchi, sha256)
+    to_compile = {}
+    skipped = 0
+    for md_file in sorted(paths):
+        key = os.path.relpath(md_file, root).replace("\\", "/")
+        with open(md_file, "rb") as f:
+            raw = f.read()
+        sha = hashlib.sha256(raw).hexdigest()
+        if manifest.get(key) == sha:
+            skipped += 1
+            continue
+        text = raw.decode("utf-8")
+        lines, blocks = extract_blocks(text)
+        pending[md_file] = (key, text, lines, blocks, sha)
+        for _, _, digest, source in blocks:
+            if not os.path.exists(os.path.join(out_dir, f"{digest}.svg")):
+                to_compile[digest] = source
+
+    timings = {}
+    failures = {}
+    if to_compile:
+        missing = [tool for tool in ("pdflatex", "pdf2svg") if shutil.which(tool) is None]
+        if missing:
+            raise RuntimeError(f"Missing required tools: {', '.join(missing)}")
+        with ProcessPoolExecutor(max_workers=jobs or os.cpu_count()) as pool:
+            futures = [
+                pool.submit(compile_block, digest, source, out_dir)
+                for digest, source in to_compile.items()
+            ]
+            for future in as_completed(futures):
+                digest, seconds, error = future.result()
+                timings[digest] = seconds
+                if error:
+                    failures[digest] = error
+
+    rewritten = []
+    for md_file, (key, text, lines, blocks, sha) in pending.items():
+        compiled = {
+            digest for _, _, digest, _ in blocks
+            if os.path.exists(os.path.join(out_dir, f"{digest}.svg"))
+        }
+        if blocks:
+            new_text = replace_blocks(lines, blocks, compiled)
+            if new_text != text:
+                _write_atomic(md_file, new_text)
+                rewritten.append(md_file)
+            sha = hashlib.sha256(new_text.encode("utf-8")).hexdigest()
+        if len(compiled) == len({digest for _, _, digest, _ in blocks}):
+            manifest[key] = sha
+        else:
+            # Resta fuori dal manifest: il prossimo giro riprova i blocchi falliti
+            manifest.pop(key, None)
+
+    _save_manifest(manifest_path, manifest)
+    summary = {
+        "files_scanned": len(pending) + skipped,
+        "files_skipped": skipped,
+        "files_rewritten": len(rewritten),
+        "rewritten": rewritten,
+        "blocks_compiled": len(timings) - len(failures),
+        "blocks_failed": failures,
+        "block_seconds": timings,
+        "compile_seconds": sum(timings.values()),
+        "wall_seconds": time.perf_counter() - started,
+    }
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compile ```tikz blocks in Markdown files to SVG")
+    parser.add_argument("root", nargs="?", default=CONTENT_DIR, help="directory to scan for .md files")
+    parser.add_argument("--jobs", "-j", type=int, default=None, help="parallel compilations (default: CPU count)")
+    parser.add_argument("--force", action="store_true", help="ignore the manifest and rescan every file")
+    args = parser.parse_args()
+
+    try:
+        summary = run(args.root, jobs=args.jobs, force=args.force)
+    except RuntimeError as e:
+        print(e)
+        sys.exit(1)
+
+    for digest, seconds in summary["block_seconds"].items():
+        error = summary["blocks_failed"].get(digest)
+        print(f"  {digest}.svg  {seconds:6.2f}s  {'FAILED: ' + error if error else 'ok'}")
+    for md_file in summary["rewritten"]:
+        print(f"Processed: {md_file}")
+    print(
+        f"{summary['files_scanned']} files ({summary['files_skipped']} unchanged, "
+        f"{summary['files_rewritten']} rewritten), {summary['blocks_compiled']} SVG compiled "
+        f"in {summary['wall_seconds']:.2f}s (compile time {summary['compile_seconds']:.2f}s)"
+    )
+    if summary["blocks_failed"]:
+        print(f"{len(summary['blocks_failed'])} blocks failed, left as ```tikz in the Markdown")
+        sys.exit(1)
+    print(f"SVG files saved in: ./{TIKZ_DIR}/")
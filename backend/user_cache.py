@@ -0,0 +1,90 @@
+"""
+Cache breve degli utenti autenticati.
+
+get_current_user gira su ogni endpoint protetto (compreso get_current_admin)
+e per ogni richiesta decodificava il JWT e faceva un find_one su users. Qui
+si tengono per USER_CACHE_TTL secondi:
+
+- token -> username, così un token già visto non viene ridecodificato
+  (la voce non sopravvive alla scadenza "exp" del token);
+- username -> UserInDB, condiviso da tutti i token dello stesso utente.
+
+Le route che modificano un utente (ruolo, stato, profilo, avatar, punti)
+chiamano invalidate(username). Con più worker uvicorn ognuno ha la sua
+cache: una modifica fatta su un altro worker si vede al più dopo il TTL.
+"""
+import os
+import time
+from collections import OrderedDict
+
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "30"))
+USER_CACHE_MAX_ENTRIES = int(os.getenv("USER_CACHE_MAX_ENTRIES", "10000"))
+
+
+class UserCache:
+    def __init__(self, ttl=USER_CACHE_TTL, max_entries=USER_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._tokens = OrderedDict()   # token -> (scadenza, username)
+        self._users = OrderedDict()    # username -> (scadenza, UserInDB)
+        self.hits = 0
+        self.misses = 0
+
+    def _get(self, table, key):
+        item = table.get(key)
+        if item is None:
+            return None
+        expires, value = item
+        if expires < time.monotonic():
+            del table[key]
+            return None
+        table.move_to_end(key)
+        return value
+
+    def _put(self, table, key, value, ttl):
+        if self.ttl <= 0 or ttl <= 0:
+            return
+        table[key] = (time.monotonic() + ttl, value)
+        table.move_to_end(key)
+        while len(table) > self.max_entries:
+            table.popitem(last=False)
+
+    def username_for(self, token):
+        return self._get(self._tokens, token)
+
+    def remember_token(self, token, username, token_exp=None):
+        ttl = self.ttl
+        if token_exp is not None:
+            ttl = min(ttl, token_exp - time.time())
+        self._put(self._tokens, token, username, ttl)
+
+    def get(self, username):
+        user = self._get(self._users, username)
+        if user is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        # Copia: le route non devono poter modificare la voce condivisa
+        return user.model_copy()
+
+    def put(self, username, user):
+        self._put(self._users, username, user, self.ttl)
+
+    def invalidate(self, username=None):
+        """Rimuove un utente (o tutti se username è None)."""
+        if username is None:
+            self._users.clear()
+            self._tokens.clear()
+        else:
+            self._users.pop(username, None)
+
+    def stats(self):
+        return {
+            "users": len(self._users),
+            "tokens": len(self._tokens),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+user_cache = UserCache()
@@ -28,8 +28,34 @@ interface Category {
 interface TheoryContentResponse {
   title: string;
   content: string;
+  // URL versionati di CSS e JS comuni a tutte le pagine (/theory/assets/...)
+  assets?: { css?: string; js?: string };
 }
 
+// Aggiunge (o aggiorna) nell'head un elemento con l'id dato
+const ensureHeadElement = (id: string, tag: "link" | "script", url: string) => {
+  const existing = document.getElementById(id);
+  if (existing) {
+    if (existing.dataset.url === url) return;
+    existing.remove();
+  }
+  if (tag === "link") {
+    const link = document.createElement("link");
+    link.id = id;
+    link.dataset.url = url;
+    link.rel = "stylesheet";
+    link.href = url;
+    document.head.appendChild(link);
+  } else {
+    const script = document.createElement("script");
+    script.id = id;
+    script.dataset.url = url;
+    script.async = true;
+    script.src = url;
+    document.head.appendChild(script);
+  }
+};
+
 const TheoryTopic = () => {
   const { topicId } = useParams<{ topicId: string }>();
   const navigate = useNavigate();
@@ -88,6 +114,14 @@ const TheoryTopic = () => {
     }
   }, [content]);
 
+  // Stili e script comuni delle pagine di teoria, caricati una volta
+  useEffect(() => {
+    const assets = content?.assets;
+    if (!assets) return;
+    if (assets.css) ensureHeadElement("theory-assets-css", "link", `${api.defaults.baseURL}${assets.css}`);
+    if (assets.js) ensureHeadElement("theory-assets-js", "script", `${api.defaults.baseURL}${assets.js}`);
+  }, [content]);
+
   const getContentPath = () => {
     if (!topicId) return null;
     const baseRoute = `/theory/${topicId}/`;